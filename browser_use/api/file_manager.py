@@ -10,109 +10,277 @@ Sistema di gestione file per task browser-use con:
 """
 
 import asyncio
-import json
+import copy
+import importlib.util
 import logging
 import os
 import shutil
+import threading
+import time
 import zipfile
-from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple
+from functools import cached_property
+
+from browser_use.api.json_utils import dumps_json
+
+try:
+    from zlib_ng import zlib_ng as _fast_zlib
+except ImportError:
+    _fast_zlib = None
 
 logger = logging.getLogger(__name__)
 
+_ARCHIVE_COPY_BUFSIZE = 1 << 20
+
+# Massimo numero di directory fd di task tenuti aperti (evita di esaurire i file descriptor)
+_MAX_CACHED_DIR_FDS = 128
+
+# open() relativo a un directory fd non è disponibile ovunque (es. Windows)
+_SUPPORTS_DIR_FD = os.open in os.supports_dir_fd and hasattr(os, 'O_DIRECTORY')
+
+# Formati già compressi: DEFLATE brucia CPU senza ridurre la dimensione
+_STORED_SUFFIXES = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.webp', '.zip'})
+
+
+def _load_fast_zipfile():
+    """Copia privata del modulo zipfile che comprime con zlib-ng (drop-in API-compatibile, DEFLATE SIMD)
+
+    zipfile legge zlib/crc32 dai suoi globali: sostituirli nel modulo condiviso cambierebbe la compressione
+    di ogni altro thread che usa zipfile. La copia non è registrata in sys.modules e la usa solo _archive_task_sync.
+    """
+    spec = importlib.util.find_spec('zipfile')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.zlib = _fast_zlib
+    module.crc32 = _fast_zlib.crc32
+    return module
+
+
+_archive_zipfile = _load_fast_zipfile() if _fast_zlib is not None else zipfile
+
+
+def _iter_file_entries(root: Path) -> Iterator[os.DirEntry]:
+    """Itera ricorsivamente i file sotto root con os.scandir (stat dalla entry, niente Path)"""
+    stack = [os.fspath(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+
+def _walk_size(root: Path, suffix: Optional[str] = None) -> Tuple[int, int]:
+    """Calcola (file_count, total_bytes) di un albero in un singolo passaggio"""
+    file_count = 0
+    total_bytes = 0
+    for entry in _iter_file_entries(root):
+        if suffix is not None and not entry.name.endswith(suffix):
+            continue
+        file_count += 1
+        total_bytes += entry.stat(follow_symlinks=False).st_size
+    return file_count, total_bytes
+
+
+def _scan_tree(root: Path, suffix: Optional[str] = None) -> Tuple[int, int, int]:
+    """Calcola (top_dir_count, file_count, total_bytes) con un solo scandir per directory"""
+    top_dir_count = 0
+    file_count = 0
+    total_bytes = 0
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    top_dir_count += 1
+                    sub_count, sub_bytes = _walk_size(entry.path, suffix)
+                    file_count += sub_count
+                    total_bytes += sub_bytes
+                elif entry.is_file(follow_symlinks=False):
+                    if suffix is not None and not entry.name.endswith(suffix):
+                        continue
+                    file_count += 1
+                    total_bytes += entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return top_dir_count, file_count, total_bytes
+
 
-@dataclass
 class TaskFiles:
-    """Rappresenta i file associati a un task"""
-    task_id: str
-    task_dir: Path
-    history_file: Optional[Path] = None
-    gif_file: Optional[Path] = None
-    screenshots: List[Path] = None
-    error_file: Optional[Path] = None
-    
-    def __post_init__(self):
-        if self.screenshots is None:
-            self.screenshots = []
+    """Rappresenta i file associati a un task
+
+    I campi sono risolti al primo accesso e poi messi in cache: chi legge solo
+    history_file paga un solo stat, senza scansione della directory.
+    """
+
+    def __init__(self, task_id: str, task_dir: Path):
+        self.task_id = task_id
+        self.task_dir = task_dir
+
+    def __repr__(self) -> str:
+        return f"TaskFiles(task_id={self.task_id!r}, task_dir={self.task_dir!r})"
+
+    def _existing(self, file_name: str) -> Optional[Path]:
+        file_path = self.task_dir / file_name
+        return file_path if os.path.isfile(file_path) else None
+
+    @cached_property
+    def history_file(self) -> Optional[Path]:
+        return self._existing(f"{self.task_id}.json")
+
+    @cached_property
+    def gif_file(self) -> Optional[Path]:
+        return self._existing(f"{self.task_id}.gif")
+
+    @cached_property
+    def error_file(self) -> Optional[Path]:
+        return self._existing(f"{self.task_id}_error.json")
+
+    @cached_property
+    def screenshots(self) -> List[Path]:
+        try:
+            with os.scandir(self.task_dir) as it:
+                names = sorted(
+                    entry.name for entry in it
+                    if entry.name.startswith("step_") and entry.name.endswith(".jpg") and entry.is_file()
+                )
+        except FileNotFoundError:
+            return []
+        return [self.task_dir / name for name in names]
 
 
 class FileManager:
     """Gestore file per task browser-use"""
-    
-    def __init__(self, base_dir: Path):
+
+    def __init__(
+        self,
+        base_dir: Path,
+        stats_cache_ttl: float = 5.0,
+        archive_workers: Optional[int] = None
+    ):
         self.base_dir = Path(base_dir).resolve()
         self.tasks_dir = self.base_dir / "tasks"
         self.users_dir = self.base_dir / "users"
         self.archive_dir = self.base_dir / "archive"
         
-        # Crea directory necessarie
-        for dir_path in [self.tasks_dir, self.users_dir, self.archive_dir]:
-            dir_path.mkdir(parents=True, exist_ok=True)
+        # Crea directory necessarie (la prima makedirs crea anche base_dir)
+        for dir_path in (self.tasks_dir, self.users_dir, self.archive_dir):
+            os.makedirs(dir_path, exist_ok=True)
+        
+        # Cache statistiche storage: (cached_at monotonic, mtimes directory top-level, stats)
+        self.stats_cache_ttl = stats_cache_ttl
+        self._stats_cache: Optional[Tuple[float, Tuple[float, ...], Dict[str, Any]]] = None
+        
+        # Worker per archiviazione parallela: DEFLATE rilascia il GIL, quindi i thread scalano sui core
+        self.archive_workers = archive_workers or min(4, os.cpu_count() or 1)
+        
+        # Directory fd per task (ordine di inserimento = LRU) usati da save_screenshot con dir_fd
+        self._task_dir_fds: Dict[str, int] = {}
+        self._task_dir_fds_lock = threading.Lock()
         
         logger.info(f"📁 FileManager inizializzato - base_dir: {self.base_dir}")
-    
+
     def get_task_dir(self, task_id: str) -> Path:
         """Ottiene la directory di un task"""
         return self.tasks_dir / task_id
-    
+
     def get_user_dir(self, user_id: str) -> Path:
         """Ottiene la directory di un utente"""
         return self.users_dir / user_id
-    
+
     def create_task_dir(self, task_id: str) -> Path:
         """Crea directory per un task"""
         task_dir = self.get_task_dir(task_id)
         task_dir.mkdir(exist_ok=True)
-        logger.info(f"📁 Directory task creata: {task_dir}")
+        logger.debug("📁 Directory task creata: %s", task_dir)
         return task_dir
-    
+
+    def _get_task_dir_fd_locked(self, task_id: str) -> int:
+        """Ottiene (aprendolo se serve) il directory fd di un task, creando la directory
+        
+        Va chiamato con _task_dir_fds_lock acquisito, e il fd va usato prima di rilasciarlo.
+        """
+        dir_fd = self._task_dir_fds.pop(task_id, None)
+        if dir_fd is None:
+            task_dir = self.create_task_dir(task_id)
+            dir_fd = os.open(task_dir, os.O_RDONLY | os.O_DIRECTORY)
+            if len(self._task_dir_fds) >= _MAX_CACHED_DIR_FDS:
+                # Chiude il fd usato meno di recente
+                oldest_task_id = next(iter(self._task_dir_fds))
+                os.close(self._task_dir_fds.pop(oldest_task_id))
+        self._task_dir_fds[task_id] = dir_fd
+        return dir_fd
+
+    def _open_in_task_dir(self, task_id: str, file_name: str, flags: int, mode: int = 0o644) -> int:
+        """openat() di un file nella directory del task tramite il directory fd in cache
+        
+        Il lock copre anche l'openat: eviction LRU o _close_task_dir_fd in un altro thread non possono
+        chiudere il dir fd (e farne riusare il numero) mentre è in uso.
+        """
+        with self._task_dir_fds_lock:
+            dir_fd = self._get_task_dir_fd_locked(task_id)
+            try:
+                return os.open(file_name, flags, mode, dir_fd=dir_fd)
+            except FileNotFoundError:
+                # Directory rimossa fuori da cleanup_task: il fd punta a una directory cancellata,
+                # lo scarta e riprova una volta ricreando la directory
+                os.close(self._task_dir_fds.pop(task_id))
+                dir_fd = self._get_task_dir_fd_locked(task_id)
+                return os.open(file_name, flags, mode, dir_fd=dir_fd)
+
+    def _close_task_dir_fd(self, task_id: str):
+        """Chiude il directory fd in cache di un task, se presente"""
+        with self._task_dir_fds_lock:
+            dir_fd = self._task_dir_fds.pop(task_id, None)
+        if dir_fd is not None:
+            os.close(dir_fd)
+
     def create_user_dir(self, user_id: str) -> Path:
         """Crea directory per un utente"""
         user_dir = self.get_user_dir(user_id)
-        user_dir.mkdir(exist_ok=True)
         
-        # Crea sottodirectory utente
-        (user_dir / "chrome").mkdir(exist_ok=True)
-        (user_dir / "downloads").mkdir(exist_ok=True)
+        # Crea sottodirectory utente (la prima makedirs crea anche user_dir)
+        for sub_dir in ("chrome", "downloads"):
+            os.makedirs(user_dir / sub_dir, exist_ok=True)
         
         logger.info(f"👤 Directory utente creata: {user_dir}")
         return user_dir
-    
+
     def get_task_files(self, task_id: str) -> TaskFiles:
         """Ottiene tutti i file associati a un task"""
+        return TaskFiles(task_id, self.get_task_dir(task_id))
+
+    def get_history_path(self, task_id: str) -> Optional[Path]:
+        """Ottiene il file history di un task (un solo stat, senza scansione directory)"""
+        history_file = self.get_task_dir(task_id) / f"{task_id}.json"
+        return history_file if os.path.exists(history_file) else None
+
+    def iter_screenshots(self, task_id: str) -> Iterator[Path]:
+        """Itera lazy gli screenshot di un task (ordine del filesystem, non ordinati)"""
         task_dir = self.get_task_dir(task_id)
-        
-        if not task_dir.exists():
-            return TaskFiles(task_id=task_id, task_dir=task_dir)
-        
-        # File principali
-        history_file = task_dir / f"{task_id}.json"
-        gif_file = task_dir / f"{task_id}.gif"
-        error_file = task_dir / f"{task_id}_error.json"
-        
-        # Screenshots
-        screenshots = []
-        for screenshot_file in task_dir.glob("step_*.jpg"):
-            screenshots.append(screenshot_file)
-        screenshots.sort()
-        
-        return TaskFiles(
-            task_id=task_id,
-            task_dir=task_dir,
-            history_file=history_file if history_file.exists() else None,
-            gif_file=gif_file if gif_file.exists() else None,
-            screenshots=screenshots,
-            error_file=error_file if error_file.exists() else None
-        )
-    
-    def save_task_history(
+        try:
+            with os.scandir(task_dir) as it:
+                for entry in it:
+                    if entry.name.startswith("step_") and entry.name.endswith(".jpg") and entry.is_file():
+                        yield task_dir / entry.name
+        except FileNotFoundError:
+            return
+
+    async def save_task_history(
         self, 
         task_id: str, 
         history_data: Dict[str, Any]
     ) -> Path:
         """Salva la history di un task"""
+        return await asyncio.to_thread(self._save_task_history_sync, task_id, history_data)
+
+    def _save_task_history_sync(self, task_id: str, history_data: Dict[str, Any]) -> Path:
         task_dir = self.create_task_dir(task_id)
         history_file = task_dir / f"{task_id}.json"
         
@@ -123,19 +291,68 @@ class FileManager:
             "file_version": "1.0"
         })
         
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history_data, f, ensure_ascii=False, indent=2)
+        history_file.write_bytes(dumps_json(history_data))
         
-        logger.info(f"💾 History salvata: {history_file}")
+        logger.info("💾 History salvata: %s", history_file)
         return history_file
-    
-    def save_task_error(
+
+    async def save_task_history_stream(
+        self,
+        task_id: str,
+        metadata: Dict[str, Any],
+        steps: Iterable[Dict[str, Any]]
+    ) -> Path:
+        """Salva la history di un task scrivendo gli step uno alla volta (memoria costante)
+        
+        Produce lo stesso documento di save_task_history con gli step sotto la chiave "steps",
+        in JSON compatto. `steps` viene consumato nel thread di I/O: deve essere un iterabile sincrono.
+        """
+        return await asyncio.to_thread(self._save_task_history_stream_sync, task_id, metadata, steps)
+
+    def _save_task_history_stream_sync(
+        self,
+        task_id: str,
+        metadata: Dict[str, Any],
+        steps: Iterable[Dict[str, Any]]
+    ) -> Path:
+        task_dir = self.create_task_dir(task_id)
+        history_file = task_dir / f"{task_id}.json"
+        
+        header = {k: v for k, v in metadata.items() if k != "steps"}
+        header.update({
+            "task_id": task_id,
+            "saved_at": datetime.now(timezone.utc).isoformat(),
+            "file_version": "1.0"
+        })
+        
+        with open(history_file, 'wb') as f:
+            # Header senza la graffa di chiusura, poi l'array steps scritto incrementalmente
+            f.write(dumps_json(header, indent=False)[:-1])
+            f.write(b',"steps":[')
+            for i, step in enumerate(steps):
+                if i:
+                    f.write(b',')
+                f.write(dumps_json(step, indent=False))
+            f.write(b']}')
+        
+        logger.info("💾 History salvata (stream): %s", history_file)
+        return history_file
+
+    async def save_task_error(
         self, 
         task_id: str, 
         error_message: str,
         error_details: Optional[Dict[str, Any]] = None
     ) -> Path:
         """Salva errore di un task"""
+        return await asyncio.to_thread(self._save_task_error_sync, task_id, error_message, error_details)
+
+    def _save_task_error_sync(
+        self,
+        task_id: str,
+        error_message: str,
+        error_details: Optional[Dict[str, Any]] = None
+    ) -> Path:
         task_dir = self.create_task_dir(task_id)
         error_file = task_dir / f"{task_id}_error.json"
         
@@ -146,42 +363,46 @@ class FileManager:
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
         
-        with open(error_file, 'w', encoding='utf-8') as f:
-            json.dump(error_data, f, ensure_ascii=False, indent=2)
+        error_file.write_bytes(dumps_json(error_data))
         
-        logger.info(f"❌ Errore salvato: {error_file}")
+        logger.info("❌ Errore salvato: %s", error_file)
         return error_file
-    
-    def save_screenshot(
+
+    async def save_screenshot(
         self, 
         task_id: str, 
         step_number: int,
         screenshot_data: bytes
     ) -> Path:
         """Salva screenshot di uno step"""
-        task_dir = self.create_task_dir(task_id)
-        screenshot_file = task_dir / f"step_{step_number:03d}.jpg"
-        
-        with open(screenshot_file, 'wb') as f:
-            f.write(screenshot_data)
-        
-        logger.info(f"📸 Screenshot salvato: {screenshot_file}")
+        return await asyncio.to_thread(self._save_screenshot_sync, task_id, step_number, screenshot_data)
+
+    def _save_screenshot_sync(self, task_id: str, step_number: int, screenshot_data: bytes) -> Path:
+        file_name = f"step_{step_number:03d}.jpg"
+        
+        if _SUPPORTS_DIR_FD:
+            # openat() relativo al directory fd in cache: niente risoluzione del path del task ad ogni step
+            fd = self._open_in_task_dir(task_id, file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            try:
+                view = memoryview(screenshot_data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+            screenshot_file = self.get_task_dir(task_id) / file_name
+        else:
+            screenshot_file = self.create_task_dir(task_id) / file_name
+            with open(screenshot_file, 'wb') as f:
+                f.write(screenshot_data)
+        
+        logger.debug("📸 Screenshot salvato: %s", screenshot_file)
         return screenshot_file
-    
+
     def get_task_size(self, task_id: str) -> int:
         """Ottiene la dimensione totale dei file di un task (in bytes)"""
-        task_files = self.get_task_files(task_id)
-        
-        if not task_files.task_dir.exists():
-            return 0
-        
-        total_size = 0
-        for file_path in task_files.task_dir.rglob("*"):
-            if file_path.is_file():
-                total_size += file_path.stat().st_size
-        
+        _, total_size = _walk_size(self.get_task_dir(task_id))
         return total_size
-    
+
     def get_user_storage_usage(self, user_id: str) -> Dict[str, Any]:
         """Ottiene l'utilizzo storage di un utente"""
         user_dir = self.get_user_dir(user_id)
@@ -189,13 +410,7 @@ class FileManager:
         if not user_dir.exists():
             return {"total_bytes": 0, "file_count": 0}
         
-        total_bytes = 0
-        file_count = 0
-        
-        for file_path in user_dir.rglob("*"):
-            if file_path.is_file():
-                total_bytes += file_path.stat().st_size
-                file_count += 1
+        file_count, total_bytes = _walk_size(user_dir)
         
         return {
             "user_id": user_id,
@@ -203,96 +418,131 @@ class FileManager:
             "total_mb": round(total_bytes / (1024 * 1024), 2),
             "file_count": file_count
         }
-    
-    def archive_task(self, task_id: str) -> Optional[Path]:
+
+    async def archive_task(self, task_id: str) -> Optional[Path]:
         """Archivia un task in formato ZIP"""
-        task_files = self.get_task_files(task_id)
+        return await asyncio.to_thread(self._archive_task_sync, task_id)
+
+    def _archive_task_sync(self, task_id: str) -> Optional[Path]:
+        task_dir = self.get_task_dir(task_id)
         
-        if not task_files.task_dir.exists():
+        if not task_dir.exists():
             logger.warning(f"⚠️ Directory task non esiste: {task_id}")
             return None
         
         # Crea archive ZIP
         archive_file = self.archive_dir / f"{task_id}.zip"
         
-        with zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in task_files.task_dir.rglob("*"):
-                if file_path.is_file():
-                    # Path relativo nella ZIP
-                    arcname = file_path.relative_to(task_files.task_dir)
-                    zipf.write(file_path, arcname)
+        with _archive_zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for entry in _iter_file_entries(task_dir):
+                # Path relativo nella ZIP
+                arcname = os.path.relpath(entry.path, task_dir)
+                zinfo = _archive_zipfile.ZipInfo.from_file(entry.path, arcname)
+                if os.path.splitext(entry.name)[1].lower() in _STORED_SUFFIXES:
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                else:
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                
+                # Copia a blocchi da 1 MiB: meno read()/write() rispetto al buffering di ZipFile.write
+                with open(entry.path, 'rb', buffering=0) as src, zipf.open(zinfo, 'w') as dst:
+                    shutil.copyfileobj(src, dst, _ARCHIVE_COPY_BUFSIZE)
         
         logger.info(f"📦 Task archiviato: {archive_file}")
         return archive_file
-    
-    def cleanup_task(self, task_id: str, archive_first: bool = True) -> bool:
+
+    async def cleanup_task(self, task_id: str, archive_first: bool = True) -> bool:
         """Pulisce i file di un task"""
-        task_files = self.get_task_files(task_id)
+        return await asyncio.to_thread(self._cleanup_task_sync, task_id, archive_first)
+
+    def _cleanup_task_sync(self, task_id: str, archive_first: bool = True) -> bool:
+        task_dir = self.get_task_dir(task_id)
+        self._close_task_dir_fd(task_id)
         
-        if not task_files.task_dir.exists():
+        if not task_dir.exists():
             return True
         
         # Archivia prima se richiesto
         if archive_first:
-            self.archive_task(task_id)
+            self._archive_task_sync(task_id)
         
         # Rimuovi directory task
         try:
-            shutil.rmtree(task_files.task_dir)
-            logger.info(f"🧹 Task pulito: {task_id}")
+            shutil.rmtree(task_dir)
+            logger.debug("🧹 Task pulito: %s", task_id)
             return True
         except Exception as e:
             logger.error(f"❌ Errore pulizia task {task_id}: {e}")
             return False
-    
-    def cleanup_old_tasks(
+
+    async def cleanup_old_tasks(
         self, 
         max_age_days: int = 7,
         archive_before_delete: bool = True
     ) -> Dict[str, Any]:
         """Pulisce task vecchi"""
-        
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+        return await asyncio.to_thread(self._cleanup_old_tasks_sync, max_age_days, archive_before_delete)
+
+    def _cleanup_old_tasks_sync(self, max_age_days: int, archive_before_delete: bool) -> Dict[str, Any]:
+        # Cutoff come timestamp POSIX: il confronto per entry è tra float
+        cutoff_ts = time.time() - max_age_days * 86400
         
         cleaned_tasks = []
         errors = []
+        expired_tasks = []
         
-        for task_dir in self.tasks_dir.iterdir():
-            if not task_dir.is_dir():
-                continue
-            
-            # Controlla età directory
-            dir_mtime = datetime.fromtimestamp(
-                task_dir.stat().st_mtime, 
-                tz=timezone.utc
-            )
-            
-            if dir_mtime < cutoff_date:
-                task_id = task_dir.name
+        # Un solo scandir: tipo e mtime arrivano dalla DirEntry, senza Path né datetime per entry
+        with os.scandir(self.tasks_dir) as it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
                 
-                try:
-                    if self.cleanup_task(task_id, archive_first=archive_before_delete):
+                # Controlla età directory
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff_ts:
+                    expired_tasks.append(entry.name)
+        
+        # Archivia e rimuovi in parallelo (la compressione è CPU-bound)
+        def cleanup_one(task_id: str) -> Tuple[str, Optional[str]]:
+            try:
+                if self._cleanup_task_sync(task_id, archive_first=archive_before_delete):
+                    return task_id, None
+                return task_id, f"Errore pulizia {task_id}"
+            except Exception as e:
+                return task_id, f"Errore {task_id}: {str(e)}"
+        
+        if expired_tasks:
+            with ThreadPoolExecutor(max_workers=self.archive_workers) as pool:
+                for task_id, error in pool.map(cleanup_one, expired_tasks):
+                    if error is None:
                         cleaned_tasks.append(task_id)
                     else:
-                        errors.append(f"Errore pulizia {task_id}")
-                        
-                except Exception as e:
-                    errors.append(f"Errore {task_id}: {str(e)}")
+                        errors.append(error)
         
         result = {
             "cleaned_count": len(cleaned_tasks),
             "error_count": len(errors),
             "cleaned_tasks": cleaned_tasks,
             "errors": errors,
-            "cutoff_date": cutoff_date.isoformat()
+            "cutoff_date": datetime.fromtimestamp(cutoff_ts, tz=timezone.utc).isoformat()
         }
         
-        logger.info(f"🧹 Cleanup completato: {result}")
+        logger.info(
+            "🧹 Cleanup completato: %d task puliti, %d errori",
+            result["cleaned_count"], result["error_count"]
+        )
         return result
-    
+
     def get_storage_stats(self) -> Dict[str, Any]:
         """Ottiene statistiche storage globali"""
         
+        # Riusa l'ultimo risultato se le directory top-level non sono cambiate e il TTL non è scaduto.
+        # Le scritture dentro sottodirectory esistenti non aggiornano queste mtime: il TTL ne limita la staleness.
+        mtimes = self._get_top_level_mtimes()
+        now = time.monotonic()
+        if self._stats_cache is not None:
+            cached_at, cached_mtimes, cached_stats = self._stats_cache
+            if cached_mtimes == mtimes and now - cached_at < self.stats_cache_ttl:
+                return copy.deepcopy(cached_stats)
+        
         stats = {
             "base_dir": str(self.base_dir),
             "total_tasks": 0,
@@ -306,39 +556,12 @@ class FileManager:
             }
         }
         
-        # Conta task
-        if self.tasks_dir.exists():
-            stats["total_tasks"] = len([
-                d for d in self.tasks_dir.iterdir() if d.is_dir()
-            ])
-            
-            # Calcola dimensione tasks
-            for item in self.tasks_dir.rglob("*"):
-                if item.is_file():
-                    stats["storage_usage"]["tasks_bytes"] += item.stat().st_size
-        
-        # Conta utenti
-        if self.users_dir.exists():
-            stats["total_users"] = len([
-                d for d in self.users_dir.iterdir() if d.is_dir()
-            ])
-            
-            # Calcola dimensione utenti
-            for item in self.users_dir.rglob("*"):
-                if item.is_file():
-                    stats["storage_usage"]["users_bytes"] += item.stat().st_size
-        
-        # Conta archivi
-        if self.archive_dir.exists():
-            stats["total_archives"] = len([
-                f for f in self.archive_dir.iterdir() 
-                if f.is_file() and f.suffix == '.zip'
-            ])
-            
-            # Calcola dimensione archivi
-            for item in self.archive_dir.rglob("*.zip"):
-                if item.is_file():
-                    stats["storage_usage"]["archives_bytes"] += item.stat().st_size
+        # Conta task/utenti/archivi e calcola dimensioni in un unico passaggio per albero
+        stats["total_tasks"], _, stats["storage_usage"]["tasks_bytes"] = _scan_tree(self.tasks_dir)
+        stats["total_users"], _, stats["storage_usage"]["users_bytes"] = _scan_tree(self.users_dir)
+        _, stats["total_archives"], stats["storage_usage"]["archives_bytes"] = _scan_tree(
+            self.archive_dir, suffix='.zip'
+        )
         
         # Totale
         usage = stats["storage_usage"]
@@ -349,13 +572,24 @@ class FileManager:
         )
         
         # Converti in MB per leggibilità
-        for key in usage:
+        for key in list(usage):
             if key.endswith("_bytes"):
                 mb_key = key.replace("_bytes", "_mb")
                 usage[mb_key] = round(usage[key] / (1024 * 1024), 2)
         
+        self._stats_cache = (now, mtimes, copy.deepcopy(stats))
         return stats
 
+    def _get_top_level_mtimes(self) -> Tuple[float, ...]:
+        """Ottiene le mtime delle directory tasks/users/archive (0 se mancanti)"""
+        mtimes = []
+        for dir_path in (self.tasks_dir, self.users_dir, self.archive_dir):
+            try:
+                mtimes.append(os.stat(dir_path).st_mtime)
+            except FileNotFoundError:
+                mtimes.append(0.0)
+        return tuple(mtimes)
+
 
 # Istanza globale file manager
 file_manager: Optional[FileManager] = None
@@ -381,9 +615,9 @@ def create_task_dir(task_id: str) -> Path:
     return get_file_manager().create_task_dir(task_id)
 
 
-def save_task_history(task_id: str, history_data: Dict[str, Any]) -> Path:
+async def save_task_history(task_id: str, history_data: Dict[str, Any]) -> Path:
     """Salva history task"""
-    return get_file_manager().save_task_history(task_id, history_data)
+    return await get_file_manager().save_task_history(task_id, history_data)
 
 
 def get_task_files(task_id: str) -> TaskFiles:
@@ -391,6 +625,11 @@ def get_task_files(task_id: str) -> TaskFiles:
     return get_file_manager().get_task_files(task_id)
 
 
+def get_history_path(task_id: str) -> Optional[Path]:
+    """Ottiene file history di un task"""
+    return get_file_manager().get_history_path(task_id)
+
+
 def get_storage_stats() -> Dict[str, Any]:
     """Ottiene statistiche storage"""
     return get_file_manager().get_storage_stats()
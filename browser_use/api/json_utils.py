@@ -0,0 +1,23 @@
+"""
+# @file purpose: Serializzazione JSON condivisa da server e file manager
+
+orjson se installato (più veloce, restituisce già bytes), altrimenti json della stdlib.
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(data: Any, indent: bool = True) -> bytes:
+    """Serializza in JSON UTF-8 (orjson se disponibile, altrimenti stdlib json)"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    if indent:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
@@ -10,10 +10,11 @@ Sistema avanzato per il monitoring dei task browser-use con:
 """
 
 import asyncio
+import heapq
 import logging
 import time
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
@@ -30,7 +31,11 @@ class TaskStatus(Enum):
     STALLED = "stalled"
 
 
-@dataclass
+# Stati finali: il task ha un completed_at ed è idoneo al cleanup
+_TERMINAL_STATUSES = frozenset({TaskStatus.COMPLETED, TaskStatus.ERROR, TaskStatus.CANCELLED})
+
+
+@dataclass(slots=True)
 class TaskMetrics:
     """Metriche di un task"""
     task_id: str
@@ -41,7 +46,11 @@ class TaskMetrics:
     created_at: datetime
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
-    last_activity: Optional[datetime] = None
+    # Clock monotonic (time.monotonic()) per i calcoli interni; i datetime sopra solo per output
+    created_ts: float = 0.0
+    started_ts: Optional[float] = None
+    completed_ts: Optional[float] = None
+    last_activity_ts: Optional[float] = None
     duration_seconds: float = 0
     error_message: Optional[str] = None
     stall_count: int = 0
@@ -55,16 +64,30 @@ class TaskMonitor:
         self,
         stall_timeout: int = 60,  # secondi senza attività prima di considerare stalled
         max_stall_checks: int = 3,  # numero massimo controlli stall prima di marcare failed
-        cleanup_interval: int = 300  # secondi tra cleanup task completati
+        cleanup_interval: int = 300,  # secondi tra cleanup task completati
+        stall_check_interval: int = 10  # secondi tra controlli successivi di un task già inattivo
     ):
         self.stall_timeout = stall_timeout
         self.max_stall_checks = max_stall_checks  
         self.cleanup_interval = cleanup_interval
+        self.stall_check_interval = stall_check_interval
         
         # Storage metriche task
         self.task_metrics: Dict[str, TaskMetrics] = {}
+        
+        # Indici secondari (task_id per status/utente) mantenuti da register/update/cleanup
+        self._by_status: Dict[TaskStatus, Set[str]] = {status: set() for status in TaskStatus}
+        self._by_user: Dict[str, Set[str]] = {}
+        
+        # Min-heap (next_check_ts, last_activity_ts, task_id) dei task RUNNING con cancellazione lazy:
+        # un'entry è valida solo se coincide con metrics.last_activity_ts; next_check_ts è il prossimo
+        # controllo stall del task (attività + stall_timeout, poi ogni stall_check_interval)
+        self._running_activity: List[Tuple[float, float, str]] = []
+        
         self.monitoring_active = False
         self._monitor_task: Optional[asyncio.Task] = None
+        # Sveglia il monitoring loop quando cambia attività/stato (nessun polling a vuoto)
+        self._wake = asyncio.Event()
         
         logger.info(f"📊 TaskMonitor inizializzato - stall_timeout: {stall_timeout}s")
     
@@ -83,10 +106,16 @@ class TaskMonitor:
             steps_completed=0,
             steps_target=max_steps,
             created_at=datetime.now(timezone.utc),
+            created_ts=time.monotonic(),
             resource_usage={}
         )
         
+        if task_id in self.task_metrics:
+            self._remove_task(task_id)
+        
         self.task_metrics[task_id] = metrics
+        self._by_status[TaskStatus.QUEUED].add(task_id)
+        self._by_user.setdefault(user_id, set()).add(task_id)
         logger.info(f"📝 Task registrato per monitoring: {task_id}")
         
         return metrics
@@ -109,7 +138,11 @@ class TaskMonitor:
         
         # Aggiorna metriche
         metrics.status = status
-        metrics.last_activity = datetime.now(timezone.utc)
+        if status != old_status:
+            self._by_status[old_status].discard(task_id)
+            self._by_status[status].add(task_id)
+        now = self._touch_activity(metrics)
+        self._wake.set()
         
         if steps_completed is not None:
             metrics.steps_completed = steps_completed
@@ -119,16 +152,16 @@ class TaskMonitor:
         
         # Timestamp specifici per stati
         if status == TaskStatus.RUNNING and old_status == TaskStatus.QUEUED:
+            metrics.started_ts = now
             metrics.started_at = datetime.now(timezone.utc)
             
-        elif status in [TaskStatus.COMPLETED, TaskStatus.ERROR, TaskStatus.CANCELLED]:
+        elif status in _TERMINAL_STATUSES:
+            metrics.completed_ts = now
             metrics.completed_at = datetime.now(timezone.utc)
-            if metrics.started_at:
-                metrics.duration_seconds = (
-                    metrics.completed_at - metrics.started_at
-                ).total_seconds()
+            if metrics.started_ts is not None:
+                metrics.duration_seconds = now - metrics.started_ts
         
-        logger.info(f"📊 Task {task_id}: {old_status.value} -> {status.value}")
+        logger.info("📊 Task %s: %s -> %s", task_id, old_status.value, status.value)
     
     def update_task_progress(self, task_id: str, steps_completed: int):
         """Aggiorna il progresso di un task"""
@@ -141,11 +174,16 @@ class TaskMonitor:
         # Solo se progresso effettivo
         if steps_completed > metrics.steps_completed:
             metrics.steps_completed = steps_completed
-            metrics.last_activity = datetime.now(timezone.utc)
+            self._touch_activity(metrics)
+            self._wake.set()
             metrics.stall_count = 0  # Reset stall counter su progresso
             
-            progress_pct = (steps_completed / metrics.steps_target) * 100
-            logger.info(f"📈 Task {task_id}: step {steps_completed}/{metrics.steps_target} ({progress_pct:.1f}%)")
+            if logger.isEnabledFor(logging.DEBUG):
+                progress_pct = (steps_completed / metrics.steps_target) * 100
+                logger.debug(
+                    "📈 Task %s: step %d/%d (%.1f%%)",
+                    task_id, steps_completed, metrics.steps_target, progress_pct
+                )
     
     def get_task_metrics(self, task_id: str) -> Optional[TaskMetrics]:
         """Ottiene le metriche di un task"""
@@ -154,36 +192,33 @@ class TaskMonitor:
     def get_user_tasks(self, user_id: str) -> List[TaskMetrics]:
         """Ottiene tutti i task di un utente"""
         return [
-            metrics for metrics in self.task_metrics.values()
-            if metrics.user_id == user_id
+            self.task_metrics[task_id]
+            for task_id in self._by_user.get(user_id, ())
         ]
     
     def get_active_tasks(self) -> List[TaskMetrics]:
         """Ottiene tutti i task attivi (running/queued)"""
         return [
-            metrics for metrics in self.task_metrics.values()
-            if metrics.status in [TaskStatus.QUEUED, TaskStatus.RUNNING]
+            self.task_metrics[task_id]
+            for status in (TaskStatus.QUEUED, TaskStatus.RUNNING)
+            for task_id in self._by_status[status]
         ]
     
     def get_system_stats(self) -> Dict[str, Any]:
         """Ottiene statistiche di sistema"""
         
         total_tasks = len(self.task_metrics)
-        active_tasks = len(self.get_active_tasks())
+        active = self.get_active_tasks()
+        active_tasks = len(active)
         
         # Conteggi per status
-        status_counts = {}
-        for status in TaskStatus:
-            status_counts[status.value] = len([
-                m for m in self.task_metrics.values() 
-                if m.status == status
-            ])
+        status_counts = {
+            status.value: len(task_ids)
+            for status, task_ids in self._by_status.items()
+        }
         
         # Utenti attivi
-        active_users = len(set(
-            m.user_id for m in self.task_metrics.values()
-            if m.status in [TaskStatus.QUEUED, TaskStatus.RUNNING]
-        ))
+        active_users = len(set(m.user_id for m in active))
         
         return {
             "total_tasks": total_tasks,
@@ -193,6 +228,24 @@ class TaskMonitor:
             "monitoring_active": self.monitoring_active
         }
     
+    def _touch_activity(self, metrics: TaskMetrics) -> float:
+        """Registra attività del task; se RUNNING lo (ri)mette nello heap dei candidati stall"""
+        ts = time.monotonic()
+        metrics.last_activity_ts = ts
+        if metrics.status == TaskStatus.RUNNING:
+            heapq.heappush(self._running_activity, (ts + self.stall_timeout, ts, metrics.task_id))
+        return ts
+    
+    def _remove_task(self, task_id: str):
+        """Rimuove un task dalle metriche e dagli indici secondari"""
+        metrics = self.task_metrics.pop(task_id)
+        self._by_status[metrics.status].discard(task_id)
+        user_tasks = self._by_user.get(metrics.user_id)
+        if user_tasks is not None:
+            user_tasks.discard(task_id)
+            if not user_tasks:
+                del self._by_user[metrics.user_id]
+    
     async def start_monitoring(self):
         """Avvia il monitoring loop"""
         
@@ -222,7 +275,7 @@ class TaskMonitor:
         """Loop principale di monitoring"""
         
         logger.info("🔄 Avvio loop monitoring")
-        last_cleanup = time.time()
+        last_cleanup = time.monotonic()
         
         while self.monitoring_active:
             try:
@@ -230,12 +283,19 @@ class TaskMonitor:
                 await self._check_stalled_tasks()
                 
                 # Cleanup periodico
-                if time.time() - last_cleanup > self.cleanup_interval:
+                if time.monotonic() - last_cleanup > self.cleanup_interval:
                     await self._cleanup_old_tasks()
-                    last_cleanup = time.time()
+                    last_cleanup = time.monotonic()
                 
-                # Aspetta prima del prossimo check
-                await asyncio.sleep(10)  # Check ogni 10 secondi
+                # Dorme fino alla prossima scadenza stall/cleanup o fino a un update dei task
+                try:
+                    await asyncio.wait_for(
+                        self._wake.wait(),
+                        timeout=self._next_wakeup_timeout(last_cleanup)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
                 
             except asyncio.CancelledError:
                 break
@@ -245,63 +305,80 @@ class TaskMonitor:
         
         logger.info("🏁 Loop monitoring terminato")
     
+    def _next_wakeup_timeout(self, last_cleanup: float) -> float:
+        """Secondi fino alla prossima scadenza: primo task che può andare in stall o cleanup"""
+        now = time.monotonic()
+        timeout = self.cleanup_interval - (now - last_cleanup)
+        
+        if self._running_activity:
+            timeout = min(timeout, self._running_activity[0][0] - now)
+        
+        return max(timeout, 0.0)
+    
     async def _check_stalled_tasks(self):
         """Controlla task che potrebbero essere stalled"""
         
-        now = datetime.now(timezone.utc)
+        now = time.monotonic()
+        heap = self._running_activity
         
-        for task_id, metrics in self.task_metrics.items():
-            if metrics.status != TaskStatus.RUNNING:
-                continue
+        # Visita solo le entry con controllo scaduto: un risveglio anticipato (update di altri task)
+        # non conta come strike per i task già inattivi
+        still_inactive = []
+        while heap and heap[0][0] <= now:
+            next_check_ts, activity_ts, task_id = heapq.heappop(heap)
             
-            if not metrics.last_activity:
-                continue
+            metrics = self.task_metrics.get(task_id)
+            if (
+                metrics is None
+                or metrics.status != TaskStatus.RUNNING
+                or metrics.last_activity_ts != activity_ts
+            ):
+                continue  # Entry superata da attività più recente o task non più running
             
             # Calcola tempo senza attività
-            inactive_seconds = (now - metrics.last_activity).total_seconds()
+            inactive_seconds = now - activity_ts
+            metrics.stall_count += 1
             
-            if inactive_seconds > self.stall_timeout:
-                metrics.stall_count += 1
-                
-                logger.warning(
-                    f"⏰ Task {task_id} inattivo da {inactive_seconds:.0f}s "
-                    f"(stall #{metrics.stall_count})"
+            logger.warning(
+                "⏰ Task %s inattivo da %.0fs (stall #%d)",
+                task_id, inactive_seconds, metrics.stall_count
+            )
+            
+            if metrics.stall_count >= self.max_stall_checks:
+                logger.error("🚫 Task %s marcato come STALLED", task_id)
+                self.update_task_status(
+                    task_id, 
+                    TaskStatus.STALLED,
+                    error_message=f"Task stalled dopo {inactive_seconds:.0f}s di inattività"
                 )
-                
-                if metrics.stall_count >= self.max_stall_checks:
-                    logger.error(f"🚫 Task {task_id} marcato come STALLED")
-                    self.update_task_status(
-                        task_id, 
-                        TaskStatus.STALLED,
-                        error_message=f"Task stalled dopo {inactive_seconds:.0f}s di inattività"
-                    )
+            else:
+                still_inactive.append((next_check_ts + self.stall_check_interval, activity_ts, task_id))
+        
+        # Ricontrolla dopo stall_check_interval i task ancora sotto soglia stall
+        for entry in still_inactive:
+            heapq.heappush(heap, entry)
     
     async def _cleanup_old_tasks(self):
         """Pulisce task completati vecchi per liberare memoria"""
         
-        now = datetime.now(timezone.utc)
+        now = time.monotonic()
         cleanup_age = 3600  # 1 ora
         
-        to_remove = []
-        
-        for task_id, metrics in self.task_metrics.items():
-            if metrics.status not in [TaskStatus.COMPLETED, TaskStatus.ERROR, TaskStatus.CANCELLED]:
-                continue
-            
-            if not metrics.completed_at:
-                continue
-            
-            age_seconds = (now - metrics.completed_at).total_seconds()
-            
-            if age_seconds > cleanup_age:
-                to_remove.append(task_id)
-        
-        for task_id in to_remove:
-            del self.task_metrics[task_id]
-            logger.info(f"🧹 Task rimosso da monitoring: {task_id}")
-        
-        if to_remove:
-            logger.info(f"🧹 Cleanup completato - rimossi {len(to_remove)} task")
+        removed_count = 0
+        
+        # Un passaggio per indice terminale: l'entry viene rilasciata subito con pop
+        for status in _TERMINAL_STATUSES:
+            expired = [
+                task_id for task_id in self._by_status[status]
+                if self.task_metrics[task_id].completed_ts is not None
+                and now - self.task_metrics[task_id].completed_ts > cleanup_age
+            ]
+            for task_id in expired:
+                self._remove_task(task_id)
+            removed_count += len(expired)
+        
+        if removed_count:
+            logger.info("🧹 Cleanup completato - rimossi %d task", removed_count)
 
 
 # Istanza globale monitor
@@ -11,21 +11,32 @@ Estende l'architettura browser-use esistente per supportare:
 """
 
 import asyncio
+import gzip
+import hashlib
+import importlib.util
 import json
 import logging
+import multiprocessing
 import os
+import re
+import signal
+import stat
 import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
+import httpx
 import uvicorn
-from fastapi import FastAPI, HTTPException, Header, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Header, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, Response
+from pydantic import BaseModel, ConfigDict
+from starlette.requests import HTTPConnection
 
 # Browser-use imports
 from browser_use import Agent
@@ -33,7 +44,7 @@ from browser_use.browser.session import BrowserSession
 from browser_use.browser.profile import BrowserProfile
 from browser_use.controller.service import Controller
 from browser_use.llm import ChatOpenAI
-from browser_use.config import load_browser_use_config
+from browser_use.api.json_utils import dumps_json
 
 # Fix import dependencies
 try:
@@ -53,8 +64,39 @@ API_KEY = os.environ.get("BROWSER_SERVICE_API_KEY")
 if not API_KEY:
     raise ValueError("BROWSER_SERVICE_API_KEY environment variable must be set")
 
-ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "*").split(",")
+ALLOWED_ORIGINS = [
+    origin.strip().rstrip("/")
+    for origin in os.environ.get("ALLOWED_ORIGINS", "*").split(",")
+    if origin.strip()
+] or ["*"]
+# Credenziali CORS solo con origins espliciti: con "*" Starlette rifletterebbe qualsiasi Origin
+CORS_ALLOW_CREDENTIALS = "*" not in ALLOWED_ORIGINS
 DATA_DIR = Path(os.environ.get("BROWSER_USE_DATA_DIR", "./data")).resolve()
+TASK_WORKERS = int(os.environ.get("BROWSER_USE_TASK_WORKERS", "4"))
+SESSION_POOL_MAX = int(os.environ.get("SESSION_POOL_MAX", "8"))
+SESSION_POOL_MAX_IDLE = float(os.environ.get("SESSION_POOL_MAX_IDLE", "1800"))
+SESSION_POOL_SWEEP_INTERVAL = float(os.environ.get("SESSION_POOL_SWEEP_INTERVAL", "900"))
+WRITE_BATCH_SIZE = 64
+# URL pubblico del server per i link ai file (es. dietro reverse proxy); se vuoto si usa l'Host della richiesta
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "").rstrip("/")
+_WS_TO_HTTP_SCHEME = {"ws": "http", "wss": "https"}
+# Gli artefatti dei task non cambiano dopo la scrittura (path univoco per task_id)
+ARTIFACT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# "inline": agent nel processo del server; "process": un processo figlio per task (BrowserSession propria)
+TASK_EXECUTOR = os.environ.get("BROWSER_USE_TASK_EXECUTOR", "inline")
+# Allo shutdown i processi figli hanno questo tempo per chiudere il proprio browser dopo SIGTERM
+PROCESS_SHUTDOWN_TIMEOUT = 10.0
+TERMINAL_STATUSES = frozenset({"completed", "error", "cancelled", "stalled"})
+# Task terminati restano in memoria per TASK_RETENTION secondi, poi solo su disco ({task_id}_status.json)
+TASK_RETENTION = float(os.environ.get("TASK_RETENTION", "3600"))
+TASK_EVICT_INTERVAL = 60.0
+# Gli aggiornamenti di step vengono applicati al massimo 20 volte al secondo
+STEP_FLUSH_INTERVAL = 0.05
+# Massimo numero di task per richiesta a GET /task-status?ids=...
+TASK_STATUS_BATCH_MAX = 100
+# Una connessione WebSocket senza cambi di stato per WS_IDLE_TIMEOUT secondi viene chiusa (il client ripiega sul polling)
+WS_IDLE_TIMEOUT = float(os.environ.get("WS_IDLE_TIMEOUT", "600"))
+_TASK_ID_RE = re.compile(r"task-\d+-[0-9a-f]{8}")
 
 # Crea directories necessarie
 DATA_DIR.mkdir(exist_ok=True)
@@ -63,11 +105,15 @@ DATA_DIR.mkdir(exist_ok=True)
 
 logger.info(f"✅ Browser-use API configurato - Data dir: {DATA_DIR}")
 logger.info(f"✅ CORS configurato per origins: {ALLOWED_ORIGINS}")
+if not CORS_ALLOW_CREDENTIALS:
+    logger.warning("⚠️ ALLOWED_ORIGINS contiene '*': credenziali CORS disabilitate (l'autenticazione via X-API-Key non ne ha bisogno)")
 
 
 # Modelli Pydantic per API
 class TaskRequest(BaseModel):
     """Richiesta per esecuzione task"""
+    model_config = ConfigDict(extra="forbid", frozen=True)
+    
     task: str
     user_id: str
     session_id: Optional[str] = None
@@ -77,6 +123,8 @@ class TaskRequest(BaseModel):
 
 class TaskResponse(BaseModel):
     """Risposta per task creato"""
+    model_config = ConfigDict(frozen=True)
+    
     success: bool
     task_id: str
     user_id: str
@@ -86,6 +134,8 @@ class TaskResponse(BaseModel):
 
 class TaskStatus(BaseModel):
     """Status di un task"""
+    model_config = ConfigDict(frozen=True)
+    
     task_id: str
     user_id: str
     status: str  # running, completed, error, cancelled
@@ -100,78 +150,567 @@ class TaskStatus(BaseModel):
 
 # Storage globale per task e sessioni
 active_tasks: Dict[str, Dict[str, Any]] = {}
-user_sessions: Dict[str, BrowserSession] = {}
-task_agents: Dict[str, Agent] = {}
+user_sessions: "OrderedDict[str, BrowserSession]" = OrderedDict()
+task_runs: Dict[str, asyncio.Task] = {}
+
+# Indici secondari per utente: task in ordine di creazione e task attivi (queued/running)
+user_to_tasks: Dict[str, List[str]] = {}
+user_active: Dict[str, Set[str]] = {}
+
+# Coda di dispatch: i task vengono accodati una volta e consumati dai worker avviati nel lifespan
+_task_queue: asyncio.Queue[Tuple[str, TaskRequest]] = asyncio.Queue()
+
+# Process pool per TASK_EXECUTOR="process" (creato nel lifespan)
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+# Client HTTP condiviso dagli LLM (creato nel lifespan): riusa le connessioni verso il provider
+_llm_http_client: Optional[httpx.AsyncClient] = None
+
+# Eventi di cambio stato per task: l'Event viene sostituito ad ogni notifica (broadcast a tutti i waiter)
+_task_events: Dict[str, asyncio.Event] = {}
+
+# Ultimo step per task non ancora applicato ad active_tasks (vince il più recente)
+_step_slot: Dict[str, int] = {}
+_step_pending = asyncio.Event()
+
+# Coda scritture file: un solo writer raggruppa le scritture e le esegue fuori dall'event loop
+_write_queue: asyncio.Queue[Tuple[Path, bytes, bool, asyncio.Future]] = asyncio.Queue()
+
+
+def _user_browser_profile(user_id: str) -> BrowserProfile:
+    """Profilo browser persistente dell'utente (directory Chrome e storage_state dedicati)"""
+    # Directory per dati utente
+    user_dir = DATA_DIR / "users" / user_id
+    user_dir.mkdir(exist_ok=True)
+    
+    # Configurazione browser profile per utente
+    return BrowserProfile(
+        user_data_dir=str(user_dir / "chrome"),
+        storage_state=str(user_dir / "session.json"),
+        keep_alive=True,  # Mantieni sessione tra task
+        headless=False,
+        disable_security=True,
+        wait_between_actions=0.5,
+        extra_browser_args=[
+            "--disable-default-apps",
+            "--disable-infobars", 
+            "--disable-notifications",
+            "--disable-popup-blocking"
+        ]
+    )
 
 
 class UserSessionManager:
-    """Gestisce sessioni browser persistenti per ogni utente"""
+    """Gestisce sessioni browser persistenti per ogni utente (pool LRU limitato)"""
+    
+    # Metriche del pool esposte su /health
+    stats: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+    _last_used: Dict[str, float] = {}
+    _in_use: Dict[str, int] = {}
+    # Lock per utente e numero di coroutine che lo usano: la entry vive solo finché serve
+    _locks: Dict[str, asyncio.Lock] = {}
+    _lock_users: Dict[str, int] = {}
     
     @staticmethod
-    async def get_or_create_session(user_id: str) -> BrowserSession:
-        """Ottiene o crea una sessione browser per l'utente"""
-        if user_id not in user_sessions:
-            logger.info(f"🔄 Creando nuova sessione browser per utente: {user_id}")
-            
-            # Directory per dati utente
-            user_dir = DATA_DIR / "users" / user_id
-            user_dir.mkdir(exist_ok=True)
-            
-            # Configurazione browser profile per utente
-            profile = BrowserProfile(
-                user_data_dir=str(user_dir / "chrome"),
-                storage_state=str(user_dir / "session.json"),
-                keep_alive=True,  # Mantieni sessione tra task
-                headless=False,
-                disable_security=True,
-                wait_between_actions=0.5,
-                extra_browser_args=[
-                    "--disable-default-apps",
-                    "--disable-infobars", 
-                    "--disable-notifications",
-                    "--disable-popup-blocking"
-                ]
-            )
-            
-            # Crea sessione browser
-            session = BrowserSession(browser_profile=profile)
-            await session.start()
-            user_sessions[user_id] = session
-            
-            logger.info(f"✅ Sessione browser creata per utente: {user_id}")
-            
+    @asynccontextmanager
+    async def _user_lock(user_id: str):
+        """Serializza creazione e chiusura della sessione di un utente"""
+        lock = UserSessionManager._locks.setdefault(user_id, asyncio.Lock())
+        UserSessionManager._lock_users[user_id] = UserSessionManager._lock_users.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            remaining = UserSessionManager._lock_users.pop(user_id) - 1
+            if remaining:
+                UserSessionManager._lock_users[user_id] = remaining
+            elif user_id not in user_sessions:
+                # Nessuno in attesa e nessuna sessione: il lock non serve più
+                del UserSessionManager._locks[user_id]
+    
+    @staticmethod
+    async def acquire(user_id: str) -> BrowserSession:
+        """Ottiene (o crea) la sessione browser dell'utente e la marca come in uso"""
+        async with UserSessionManager._user_lock(user_id):
+            if user_id in user_sessions:
+                UserSessionManager.stats["hits"] += 1
+                user_sessions.move_to_end(user_id)
+            else:
+                UserSessionManager.stats["misses"] += 1
+                user_sessions[user_id] = await UserSessionManager._create_session(user_id)
+            UserSessionManager._in_use[user_id] = UserSessionManager._in_use.get(user_id, 0) + 1
+            UserSessionManager._last_used[user_id] = time.monotonic()
+        
+        await UserSessionManager._evict_over_capacity()
         return user_sessions[user_id]
     
+    @staticmethod
+    def release(user_id: str):
+        """Rilascia la sessione al termine del task, lasciandola nel pool"""
+        remaining = UserSessionManager._in_use.get(user_id, 0) - 1
+        if remaining > 0:
+            UserSessionManager._in_use[user_id] = remaining
+        else:
+            UserSessionManager._in_use.pop(user_id, None)
+        if user_id in user_sessions:
+            UserSessionManager._last_used[user_id] = time.monotonic()
+    
+    @staticmethod
+    async def _create_session(user_id: str) -> BrowserSession:
+        """Crea e avvia una nuova sessione browser per l'utente"""
+        logger.info(f"🔄 Creando nuova sessione browser per utente: {user_id}")
+        
+        session = BrowserSession(browser_profile=_user_browser_profile(user_id))
+        await session.start()
+        
+        logger.info(f"✅ Sessione browser creata per utente: {user_id}")
+        return session
+    
+    @staticmethod
+    async def _evict_if_idle(user_id: str, cutoff: Optional[float] = None) -> bool:
+        """Chiude la sessione se, ricontrollato sotto il lock dell'utente, non è in uso (e inattiva da prima di cutoff)"""
+        async with UserSessionManager._user_lock(user_id):
+            if user_id not in user_sessions or user_id in UserSessionManager._in_use:
+                return False
+            if cutoff is not None and UserSessionManager._last_used.get(user_id, 0.0) >= cutoff:
+                return False
+            await UserSessionManager._close_session(user_id)
+        UserSessionManager.stats["evictions"] += 1
+        return True
+    
+    @staticmethod
+    async def _evict_over_capacity():
+        """Chiude le sessioni meno usate di recente oltre SESSION_POOL_MAX"""
+        if len(user_sessions) <= SESSION_POOL_MAX:
+            return
+        # Le sessioni con un task in corso non vengono mai chiuse; una sessione può essere
+        # acquisita durante la chiusura di un'altra, per questo _evict_if_idle ricontrolla
+        candidates = [uid for uid in user_sessions if uid not in UserSessionManager._in_use]
+        for uid in candidates:
+            if len(user_sessions) <= SESSION_POOL_MAX:
+                break
+            await UserSessionManager._evict_if_idle(uid)
+    
+    @staticmethod
+    async def evict_idle(max_idle: float) -> int:
+        """Chiude le sessioni inattive da più di max_idle secondi"""
+        cutoff = time.monotonic() - max_idle
+        candidates = [
+            uid for uid in user_sessions
+            if uid not in UserSessionManager._in_use
+            and UserSessionManager._last_used.get(uid, 0.0) < cutoff
+        ]
+        evicted = 0
+        for uid in candidates:
+            evicted += await UserSessionManager._evict_if_idle(uid, cutoff)
+        return evicted
+    
+    @staticmethod
+    async def aclose():
+        """Chiude tutte le sessioni browser (shutdown del server)"""
+        await asyncio.gather(*(UserSessionManager.cleanup_session(uid) for uid in list(user_sessions)))
+    
     @staticmethod
     async def cleanup_session(user_id: str):
         """Pulisce la sessione di un utente"""
+        async with UserSessionManager._user_lock(user_id):
+            await UserSessionManager._close_session(user_id)
+    
+    @staticmethod
+    async def _close_session(user_id: str):
+        """Chiude la sessione dell'utente (con il suo lock acquisito)"""
         if user_id in user_sessions:
             try:
-                await user_sessions[user_id].close()
-                del user_sessions[user_id]
+                # kill() salva lo storage_state prima di chiudere il browser (keep_alive=True)
+                session = user_sessions.pop(user_id)
+                UserSessionManager._last_used.pop(user_id, None)
+                await session.kill()
                 logger.info(f"🧹 Sessione pulita per utente: {user_id}")
             except Exception as e:
                 logger.error(f"❌ Errore pulizia sessione {user_id}: {e}")
 
 
+async def _session_reaper():
+    """Chiude periodicamente le sessioni browser inattive"""
+    while True:
+        await asyncio.sleep(SESSION_POOL_SWEEP_INTERVAL)
+        evicted = await UserSessionManager.evict_idle(SESSION_POOL_MAX_IDLE)
+        if evicted:
+            logger.info(f"🧹 Chiuse {evicted} sessioni browser inattive")
+
+
+async def _task_worker(worker_id: int):
+    """Consuma la coda task ed esegue un agent alla volta"""
+    while True:
+        task_id, request = await _task_queue.get()
+        try:
+            # Task cancellato mentre era in coda
+            if active_tasks.get(task_id, {}).get("status") != "queued":
+                continue
+            # Task separato: /task-cancel può interromperlo senza cancellare il worker
+            run = asyncio.create_task(run_agent_task(task_id, request))
+            task_runs[task_id] = run
+            try:
+                await run
+            except asyncio.CancelledError:
+                # /task-cancel prima che run_agent_task parta: la coroutine non entra nel suo try e la
+                # cancellazione arriva qui. Propaga solo se è il worker stesso a essere cancellato (shutdown)
+                if not run.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            finally:
+                task_runs.pop(task_id, None)
+        except Exception as e:
+            logger.error(f"❌ Errore worker {worker_id} su task {task_id}: {e}")
+        finally:
+            _task_queue.task_done()
+
+
+def _iso(ns: int) -> str:
+    """Converte un timestamp in nanosecondi (time.time_ns) in ISO 8601 UTC"""
+    return datetime.fromtimestamp(ns / 1e9, tz=timezone.utc).isoformat()
+
+
+# Campi di servizio del record task, non esposti nelle risposte API
+_INTERNAL_TASK_FIELDS = frozenset({"has_history", "has_gif"})
+
+
+def _task_view(task_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia del task per le risposte API, senza campi interni e con i timestamp in ISO 8601"""
+    view = {
+        k: v for k, v in task_info.items()
+        if not k.endswith("_ns") and k not in _INTERNAL_TASK_FIELDS
+    }
+    view["created_at"] = _iso(task_info["created_at_ns"])
+    if "completed_at_ns" in task_info:
+        view["completed_at"] = _iso(task_info["completed_at_ns"])
+    return view
+
+
+def get_llm(model: str) -> ChatOpenAI:
+    """Crea il client LLM di un task sul client HTTP condiviso (le connessioni si riusano tramite quello)
+    
+    Un'istanza per task: ogni Agent avvolge llm.ainvoke per il proprio conteggio token, e su un'istanza
+    condivisa i wrapper si accumulerebbero un task dopo l'altro.
+    """
+    return ChatOpenAI(
+        model=model,
+        temperature=0.1,
+        http_client=_llm_http_client
+    )
+
+
+def _discard_active(user_id: str, task_id: str):
+    """Rimuove il task dall'indice dei task attivi dell'utente"""
+    active = user_active.get(user_id)
+    if active is not None:
+        active.discard(task_id)
+        if not active:
+            del user_active[user_id]
+
+
+def _notify_task(task_id: str):
+    """Sveglia i client in attesa di aggiornamenti sul task"""
+    event = _task_events.pop(task_id, None)
+    if event is not None:
+        event.set()
+
+
+def _watch_task(task_id: str) -> asyncio.Event:
+    """Event settato al prossimo _notify_task: va ottenuto prima di leggere lo stato, così nessun cambio va perso"""
+    return _task_events.setdefault(task_id, asyncio.Event())
+
+
+def _record_step(task_id: str, steps: int):
+    """Registra l'avanzamento di un task; verrà applicato dal flusher"""
+    _step_slot[task_id] = steps
+    _step_pending.set()
+
+
+def _apply_step(task_id: str, steps: int):
+    task_info = active_tasks.get(task_id)
+    if task_info is not None and task_info["steps_completed"] != steps:
+        task_info["steps_completed"] = steps
+        _notify_task(task_id)
+
+
+def _flush_task_steps(task_id: str):
+    """Applica subito l'eventuale step in sospeso di un task (es. a fine esecuzione)"""
+    steps = _step_slot.pop(task_id, None)
+    if steps is not None:
+        _apply_step(task_id, steps)
+
+
+async def _step_flusher():
+    """Applica gli step in sospeso a intervalli di STEP_FLUSH_INTERVAL, solo quando ce ne sono"""
+    global _step_slot
+    while True:
+        await _step_pending.wait()
+        await asyncio.sleep(STEP_FLUSH_INTERVAL)
+        _step_pending.clear()
+        pending, _step_slot = _step_slot, {}
+        for task_id, steps in pending.items():
+            _apply_step(task_id, steps)
+
+
+def _write_batch(batch: List[Tuple[Path, bytes, bool, asyncio.Future]]) -> List[Optional[Exception]]:
+    """Scrive un gruppo di file (eseguito in thread), con copia .gz precompressa se richiesta"""
+    errors: List[Optional[Exception]] = []
+    for path, payload, precompress, _ in batch:
+        try:
+            path.parent.mkdir(exist_ok=True)
+            if precompress:
+                path.with_name(path.name + ".gz").write_bytes(gzip.compress(payload, compresslevel=6))
+            path.write_bytes(payload)
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    return errors
+
+
+async def _file_writer():
+    """Consuma la coda scritture a gruppi di WRITE_BATCH_SIZE"""
+    while True:
+        batch = [await _write_queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE and not _write_queue.empty():
+            batch.append(_write_queue.get_nowait())
+        try:
+            errors = await asyncio.to_thread(_write_batch, batch)
+            for (_, _, _, done), error in zip(batch, errors):
+                if done.done():
+                    continue
+                if error is None:
+                    done.set_result(None)
+                else:
+                    done.set_exception(error)
+        finally:
+            for _ in batch:
+                _write_queue.task_done()
+
+
+async def _write_json(path: Path, data: Dict[str, Any], precompress: bool = False):
+    """Accoda la scrittura JSON di `data` e attende che sia su disco"""
+    done = asyncio.get_running_loop().create_future()
+    _write_queue.put_nowait((path, dumps_json(data), precompress, done))
+    await done
+
+
+def _task_record_path(task_id: str) -> Path:
+    """File con lo stato di un task rimosso dalla memoria"""
+    return DATA_DIR / "tasks" / task_id / f"{task_id}_status.json"
+
+
+async def _evict_finished_tasks() -> int:
+    """Sposta su disco i task terminati da più di TASK_RETENTION secondi"""
+    cutoff_ns = time.time_ns() - int(TASK_RETENTION * 1e9)
+    expired = [
+        (task_id, info) for task_id, info in active_tasks.items()
+        if info["status"] in TERMINAL_STATUSES
+        and info.get("completed_at_ns", info["created_at_ns"]) < cutoff_ns
+        and task_id not in task_runs
+    ]
+    if not expired:
+        return 0
+    
+    await asyncio.gather(*(_write_json(_task_record_path(task_id), info) for task_id, info in expired))
+    
+    evicted_ids = set()
+    for task_id, info in expired:
+        # Il task potrebbe essere stato modificato durante la scrittura
+        if active_tasks.get(task_id) is info:
+            del active_tasks[task_id]
+            _notify_task(task_id)  # I client WebSocket in attesa escono subito
+            evicted_ids.add(task_id)
+    for user_id in {info["user_id"] for _, info in expired}:
+        task_ids = user_to_tasks.get(user_id)
+        if task_ids:
+            task_ids[:] = [tid for tid in task_ids if tid not in evicted_ids]
+            if not task_ids:
+                del user_to_tasks[user_id]
+    return len(evicted_ids)
+
+
+async def _task_evictor():
+    """Rimuove periodicamente dalla memoria i task terminati"""
+    while True:
+        await asyncio.sleep(TASK_EVICT_INTERVAL)
+        try:
+            evicted = await _evict_finished_tasks()
+            if evicted:
+                logger.info(f"🧹 {evicted} task terminati spostati su disco")
+        except Exception as e:
+            logger.error(f"❌ Errore eviction task: {e}")
+
+
+def _read_task_record(task_id: str) -> Optional[Dict[str, Any]]:
+    """Legge lo stato salvato di un task (eseguito in thread)"""
+    try:
+        record = json.loads(_task_record_path(task_id).read_bytes())
+    except FileNotFoundError:
+        return None
+    # Record senza flag dei file: li ricaviamo dal filesystem una volta sola
+    task_dir = DATA_DIR / "tasks" / task_id
+    if "has_history" not in record:
+        record["has_history"] = (task_dir / f"{task_id}.json").is_file()
+    if "has_gif" not in record:
+        record["has_gif"] = (task_dir / f"{task_id}.gif").is_file()
+    return record
+
+
+async def _get_task_info(task_id: str) -> Optional[Dict[str, Any]]:
+    """Task in memoria o, se già rimosso, lo stato salvato su disco"""
+    task_info = active_tasks.get(task_id)
+    if task_info is None and _TASK_ID_RE.fullmatch(task_id):
+        task_info = await asyncio.to_thread(_read_task_record, task_id)
+    return task_info
+
+
+async def _cancel_background(tasks: List[asyncio.Task]):
+    """Cancella le coroutine di background e attende che terminino"""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _join_processes(processes: List[multiprocessing.Process], timeout: float):
+    """Attende l'uscita dei processi (eseguito in thread); chi non esce entro timeout viene ucciso"""
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"⚠️ Processo {process.pid} non terminato dopo SIGTERM: kill")
+            process.kill()
+            process.join()
+
+
+async def _stop_process_pool(pool: ProcessPoolExecutor):
+    """Ferma il process pool: i figli ricevono SIGTERM e chiudono il proprio browser prima di uscire
+    
+    shutdown(cancel_futures=True) da solo lascerebbe girare i task già avviati (e i loro Chrome),
+    e l'atexit dell'interprete resterebbe bloccato ad aspettarli.
+    """
+    # terminate_workers() esiste solo da Python 3.14
+    processes = list(pool._processes.values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+    await asyncio.to_thread(_join_processes, processes, PROCESS_SHUTDOWN_TIMEOUT)
+
+
+async def _stop_file_writer(writer: asyncio.Task):
+    """Completa le scritture pendenti, poi ferma il writer"""
+    await _write_queue.join()
+    await _cancel_background([writer])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Apre le risorse condivise e avvia le coroutine di background; allo shutdown le rilascia in ordine inverso"""
+    global _llm_http_client, _process_pool
+    try:
+        async with AsyncExitStack() as stack:
+            # AsyncClient.__aexit__ chiama aclose()
+            _llm_http_client = await stack.enter_async_context(httpx.AsyncClient(
+                http2=importlib.util.find_spec("h2") is not None,
+                timeout=httpx.Timeout(600.0, connect=10.0),
+                limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=600)
+            ))
+            stack.push_async_callback(UserSessionManager.aclose)
+            
+            if TASK_EXECUTOR == "process":
+                # spawn: il fork di un processo con event loop e thread attivi non è sicuro
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=TASK_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                stack.push_async_callback(_stop_process_pool, _process_pool)
+                logger.info(f"✅ Task eseguiti in processi separati ({TASK_WORKERS} processi)")
+            
+            writer = asyncio.create_task(_file_writer())
+            stack.push_async_callback(_stop_file_writer, writer)
+            
+            background = [asyncio.create_task(_task_worker(i)) for i in range(TASK_WORKERS)]
+            background.append(asyncio.create_task(_session_reaper()))
+            background.append(asyncio.create_task(_task_evictor()))
+            background.append(asyncio.create_task(_step_flusher()))
+            stack.push_async_callback(_cancel_background, background)
+            logger.info(f"✅ Avviati {TASK_WORKERS} worker per la coda task")
+            
+            yield
+    finally:
+        _llm_http_client = None
+        _process_pool = None
+        logger.info("👋 Risorse del server rilasciate")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializzata con orjson (fallback su json stdlib se non installato)"""
+    
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content, indent=False)
+
+
 # Inizializza FastAPI app
 app = FastAPI(
     title="Browser-Use Multi-User API",
     description="API REST per automazione browser multi-utente",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 # Configura CORS
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
-    allow_credentials=True,
+    allow_credentials=CORS_ALLOW_CREDENTIALS,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization", "X-API-Key"],
+    max_age=86400,  # I browser riusano il preflight per 24h
 )
 
-# Mount static files per accesso ai file generati
-app.mount("/files", StaticFiles(directory=str(DATA_DIR / "tasks")), name="task_files")
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """True se Accept-Encoding ammette gzip con q > 0 (gzip/x-gzip espliciti prevalgono su "*")"""
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def _stat_artifact(task_id: str, file_name: str, accept_gzip: bool) -> Optional[Tuple[Path, os.stat_result, bool]]:
+    """Risolve un artefatto del task (preferendo il .gz precompresso) con un solo stat (eseguito in thread)"""
+    path = DATA_DIR / "tasks" / task_id / file_name
+    if accept_gzip and file_name.endswith(".json"):
+        gz_path = path.with_name(file_name + ".gz")
+        try:
+            gz_stat = gz_path.stat()
+        except FileNotFoundError:
+            pass
+        else:
+            if stat.S_ISREG(gz_stat.st_mode):
+                return gz_path, gz_stat, True
+    try:
+        stat_result = path.stat()
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None
+    return path, stat_result, False
 
 
 # Dependency per verifica API key
@@ -184,6 +723,45 @@ async def verify_api_key(x_api_key: Optional[str] = Header(None)):
     return True
 
 
+@app.api_route("/files/{task_id}/{file_name}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_task_file(task_id: str, file_name: str, request: Request):
+    """Serve gli artefatti di un task (history JSON, GIF, screenshot)"""
+    # Solo nomi semplici dentro la directory del task: niente path traversal né file nascosti
+    if not _TASK_ID_RE.fullmatch(task_id) or os.path.basename(file_name) != file_name or file_name.startswith("."):
+        raise HTTPException(status_code=404, detail="File non trovato")
+    
+    accept_gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    artifact = await asyncio.to_thread(_stat_artifact, task_id, file_name, accept_gzip)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="File non trovato")
+    path, stat_result, gzipped = artifact
+    
+    headers = {"Cache-Control": ARTIFACT_CACHE_CONTROL}
+    if file_name.endswith(".json"):
+        headers["Vary"] = "Accept-Encoding"
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    
+    # stat_result già noto: FileResponse non ripete lo stat
+    response = FileResponse(
+        path,
+        stat_result=stat_result,
+        headers=headers,
+        media_type="application/json" if gzipped else None
+    )
+    
+    etag = response.headers["etag"]
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, **headers})
+    return response
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """True se l'ETag è tra quelli di If-None-Match (il client ha già questa versione)"""
+    if_none_match = request.headers.get("if-none-match")
+    return bool(if_none_match) and etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -192,14 +770,19 @@ async def health_check():
         "message": "Browser-use API server attivo",
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "active_sessions": len(user_sessions),
-        "active_tasks": len(active_tasks)
+        "active_tasks": len(active_tasks),
+        "queued_tasks": _task_queue.qsize(),
+        "session_pool": {
+            "size": len(user_sessions),
+            "max": SESSION_POOL_MAX,
+            **UserSessionManager.stats
+        }
     }
 
 
 @app.post("/execute-task", response_model=TaskResponse)
 async def execute_task(
     request: TaskRequest,
-    background_tasks: BackgroundTasks,
     authorized: bool = Depends(verify_api_key)
 ) -> TaskResponse:
     """Esegue un task di automazione browser per un utente"""
@@ -211,13 +794,8 @@ async def execute_task(
     logger.info(f"🚀 Nuovo task ricevuto - ID: {task_id}, Utente: {request.user_id}")
     logger.info(f"📝 Task: {request.task}")
     
-    # Controlla se utente ha già task attivo
-    user_active_tasks = [
-        t for t in active_tasks.values() 
-        if t["user_id"] == request.user_id and t["status"] == "running"
-    ]
-    
-    if user_active_tasks:
+    # Controlla se utente ha già task attivo (in coda o in esecuzione)
+    if user_active.get(request.user_id):
         raise HTTPException(
             status_code=409, 
             detail=f"Utente {request.user_id} ha già un task attivo. Completare o cancellare prima."
@@ -231,13 +809,18 @@ async def execute_task(
         "task": request.task,
         "status": "queued",
         "steps_completed": 0,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at_ns": time.time_ns(),
         "max_steps": request.max_steps,
-        "model": request.model
+        "model": request.model,
+        # Presenza file di output, aggiornata da chi li scrive (evita stat ad ogni status)
+        "has_history": False,
+        "has_gif": False
     }
+    user_to_tasks.setdefault(request.user_id, []).append(task_id)
+    user_active.setdefault(request.user_id, set()).add(task_id)
     
-    # Avvia task in background
-    background_tasks.add_task(run_agent_task, task_id, request)
+    # Accoda task per i worker
+    _task_queue.put_nowait((task_id, request))
     
     return TaskResponse(
         success=True,
@@ -248,6 +831,77 @@ async def execute_task(
     )
 
 
+async def _run_agent_inline(task_id: str, request: TaskRequest) -> str:
+    """Esegue l'agent nel processo del server sulla sessione browser persistente dell'utente"""
+    
+    # Ottieni sessione browser persistente per utente
+    session = await UserSessionManager.acquire(request.user_id)
+    
+    try:
+        # Crea agent con sessione persistente e LLM proprio del task
+        agent = Agent(
+            task=request.task,
+            llm=get_llm(request.model),
+            browser_session=session,
+            controller=Controller(),
+            # generate_gif=str(DATA_DIR / "tasks" / task_id / f"{task_id}.gif")  # Configurabile se supportato
+        )
+        
+        # Callback per aggiornamento step (coalescato dal flusher)
+        async def on_step_complete(agent_instance: Agent):
+            _record_step(task_id, len(agent_instance.history.history))
+        
+        # Esegui agent
+        logger.info(f"🏃 Esecuzione agent per task: {task_id}")
+        result = await agent.run(max_steps=request.max_steps, on_step_end=on_step_complete)
+        return str(result) if result else ""
+    
+    finally:
+        UserSessionManager.release(request.user_id)
+
+
+def _run_agent_process(task: str, user_id: str, model: str, max_steps: int) -> Tuple[str, int]:
+    """Entry point del processo figlio: browser e agent girano su un event loop dedicato"""
+    return asyncio.run(_agent_process_main(task, user_id, model, max_steps))
+
+
+async def _agent_process_main(task: str, user_id: str, model: str, max_steps: int) -> Tuple[str, int]:
+    """Esegue un task con una sessione browser propria del processo figlio"""
+    # SIGTERM dallo shutdown del server: cancella il task così il finally chiude il browser
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass  # Windows: nessun signal handler nell'event loop
+    session = BrowserSession(browser_profile=_user_browser_profile(user_id))
+    await session.start()
+    try:
+        agent = Agent(
+            task=task,
+            llm=ChatOpenAI(model=model, temperature=0.1),
+            browser_session=session,
+            controller=Controller()
+        )
+        result = await agent.run(max_steps=max_steps)
+        return (str(result) if result else "", len(agent.history.history))
+    finally:
+        await session.kill()
+
+
+async def _run_agent_in_process(task_id: str, request: TaskRequest) -> str:
+    """Esegue l'agent nel process pool (passi e cancellazione visibili solo a fine task)"""
+    logger.info(f"🏃 Esecuzione agent in processo separato per task: {task_id}")
+    result, steps = await asyncio.get_running_loop().run_in_executor(
+        _process_pool,
+        _run_agent_process,
+        request.task,
+        request.user_id,
+        request.model,
+        request.max_steps
+    )
+    active_tasks[task_id]["steps_completed"] = steps
+    return result
+
+
 async def run_agent_task(task_id: str, request: TaskRequest):
     """Esegue il task agent in background"""
     
@@ -256,68 +910,58 @@ async def run_agent_task(task_id: str, request: TaskRequest):
     try:
         logger.info(f"🤖 Avvio esecuzione task: {task_id}")
         task_info["status"] = "running"
-        
-        # Ottieni sessione browser persistente per utente
-        session = await UserSessionManager.get_or_create_session(request.user_id)
-        
-        # Configura LLM
-        config = load_browser_use_config()
-        llm = ChatOpenAI(
-            model=request.model,
-            temperature=0.1
-        )
+        _notify_task(task_id)
         
         # Crea directory output per task
         task_dir = DATA_DIR / "tasks" / task_id
         task_dir.mkdir(exist_ok=True)
         
-        # Crea agent con sessione persistente
-        agent = Agent(
-            task=request.task,
-            llm=llm,
-            browser_session=session,
-            controller=Controller(),
-            max_steps=request.max_steps,
-            # generate_gif=str(task_dir / f"{task_id}.gif")  # Configurabile se supportato
-        )
-        
-        # Salva riferimento agent
-        task_agents[task_id] = agent
-        
-        # Callback per aggiornamento step
-        def on_step_complete(step_num: int):
-            if task_id in active_tasks:
-                active_tasks[task_id]["steps_completed"] = step_num
-        
-        # Esegui agent
-        logger.info(f"🏃 Esecuzione agent per task: {task_id}")
-        result = await agent.run()
+        if _process_pool is not None:
+            result = await _run_agent_in_process(task_id, request)
+        else:
+            result = await _run_agent_inline(task_id, request)
+        _flush_task_steps(task_id)
         
         # Salva risultati
+        completed_at_ns = time.time_ns()
         result_data = {
             "task_id": task_id,
             "user_id": request.user_id,
             "task": request.task,
-            "result": str(result) if result else "",
+            "result": result,
             "status": "completed",
             "steps_completed": active_tasks[task_id]["steps_completed"],
-            "created_at": task_info["created_at"],
-            "completed_at": datetime.now(timezone.utc).isoformat()
+            "created_at": _iso(task_info["created_at_ns"]),
+            "completed_at": _iso(completed_at_ns)
         }
         
         # Salva history JSON
         history_file = task_dir / f"{task_id}.json"
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(result_data, f, ensure_ascii=False, indent=2)
+        await _write_json(history_file, result_data, precompress=True)
         
         # Aggiorna status task
         task_info.update({
             "status": "completed",
-            "completed_at": result_data["completed_at"],
-            "result": result_data["result"]
+            "completed_at_ns": completed_at_ns,
+            "result": result_data["result"],
+            "has_history": True
         })
+        _notify_task(task_id)
         
         logger.info(f"✅ Task completato: {task_id}")
+    
+    except asyncio.CancelledError:
+        if task_info["status"] == "cancelled":
+            # Cancellazione richiesta via /task-cancel: il task termina qui
+            logger.info(f"🚫 Esecuzione interrotta: {task_id}")
+            return
+        # Shutdown del server: segna il task e propaga la cancellazione al worker
+        task_info.update({
+            "status": "cancelled",
+            "completed_at_ns": time.time_ns()
+        })
+        _notify_task(task_id)
+        raise
         
     except Exception as e:
         logger.error(f"❌ Errore esecuzione task {task_id}: {e}")
@@ -326,23 +970,47 @@ async def run_agent_task(task_id: str, request: TaskRequest):
         task_info.update({
             "status": "error",
             "error_message": str(e),
-            "completed_at": datetime.now(timezone.utc).isoformat()
+            "completed_at_ns": time.time_ns()
         })
+        _notify_task(task_id)
         
         # Salva errore
         error_file = DATA_DIR / "tasks" / task_id / f"{task_id}_error.json"
-        error_file.parent.mkdir(exist_ok=True)
-        with open(error_file, 'w') as f:
-            json.dump({
+        try:
+            await _write_json(error_file, {
                 "task_id": task_id,
                 "error": str(e),
                 "timestamp": datetime.now(timezone.utc).isoformat()
-            }, f, indent=2)
+            })
+        except Exception as write_error:
+            logger.error(f"❌ Errore salvataggio errore task {task_id}: {write_error}")
     
     finally:
-        # Cleanup agent reference
-        if task_id in task_agents:
-            del task_agents[task_id]
+        _flush_task_steps(task_id)
+        _discard_active(request.user_id, task_id)
+
+
+@app.get("/task-status")
+async def get_tasks_status(
+    ids: str,
+    request: Request,
+    authorized: bool = Depends(verify_api_key)
+):
+    """Status di più task in una sola richiesta (ids separati da virgola); i task non trovati vengono omessi"""
+    
+    task_ids = list(dict.fromkeys(tid for tid in ids.split(",") if tid))
+    if len(task_ids) > TASK_STATUS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Massimo {TASK_STATUS_BATCH_MAX} task per richiesta")
+    
+    base_url = _base_url(request)
+    task_infos = await asyncio.gather(*(_get_task_info(tid) for tid in task_ids))
+    return {
+        "tasks": [
+            _build_task_status(tid, task_info, base_url)
+            for tid, task_info in zip(task_ids, task_infos)
+            if task_info is not None
+        ]
+    }
 
 
 @app.get("/task-status/{task_id}", response_model=TaskStatus)
@@ -350,39 +1018,106 @@ async def get_task_status(
     task_id: str,
     request: Request,
     authorized: bool = Depends(verify_api_key)
-) -> TaskStatus:
-    """Ottiene lo status di un task"""
+) -> Response:
+    """Ottiene lo status di un task (304 se invariato rispetto a If-None-Match)"""
     
-    if task_id not in active_tasks:
+    task_info = await _get_task_info(task_id)
+    if task_info is None:
         raise HTTPException(status_code=404, detail="Task non trovato")
     
-    task_info = active_tasks[task_id]
-    
-    # Controlla file output
-    task_dir = DATA_DIR / "tasks" / task_id
-    history_file = task_dir / f"{task_id}.json"
-    gif_file = task_dir / f"{task_id}.gif"
-    
-    has_history = history_file.exists()
-    has_gif = gif_file.exists()
+    # Il dict ha già la forma di TaskStatus: lo serializziamo senza rivalidarlo via Pydantic
+    body = dumps_json(_build_task_status(task_id, task_info, _base_url(request)), indent=False)
+    headers = {
+        "ETag": f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"',
+        "Cache-Control": "no-cache"
+    }
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _base_url(conn: HTTPConnection) -> str:
+    """Base URL per i link ai file: PUBLIC_BASE_URL o schema+Host della richiesta (senza costruire l'URL completo)"""
+    if PUBLIC_BASE_URL:
+        return PUBLIC_BASE_URL
+    scheme = conn.scope["scheme"]
+    host = conn.headers.get("host") or conn.url.netloc
+    return f"{_WS_TO_HTTP_SCHEME.get(scheme, scheme)}://{host}"
+
+
+def _build_task_status(task_id: str, task_info: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    """Costruisce lo status di un task (campi di TaskStatus) dai flag in memoria, senza accessi al filesystem"""
+    has_history = task_info.get("has_history", False)
+    has_gif = task_info.get("has_gif", False)
     
     # URLs per file se esistono
-    base_url = f"{request.url.scheme}://{request.url.netloc}"
     history_url = f"{base_url}/files/{task_id}/{task_id}.json" if has_history else None
     gif_url = f"{base_url}/files/{task_id}/{task_id}.gif" if has_gif else None
     
-    return TaskStatus(
-        task_id=task_id,
-        user_id=task_info["user_id"],
-        status=task_info["status"],
-        steps_completed=task_info["steps_completed"],
-        created_at=task_info["created_at"],
-        completed_at=task_info.get("completed_at"),
-        error_message=task_info.get("error_message"),
-        has_files=has_history or has_gif,
-        history_url=history_url,
-        gif_url=gif_url
-    )
+    return {
+        "task_id": task_id,
+        "user_id": task_info["user_id"],
+        "status": task_info["status"],
+        "steps_completed": task_info["steps_completed"],
+        "created_at": _iso(task_info["created_at_ns"]),
+        "completed_at": _iso(task_info["completed_at_ns"]) if "completed_at_ns" in task_info else None,
+        "error_message": task_info.get("error_message"),
+        "has_files": has_history or has_gif,
+        "gif_url": gif_url,
+        "history_url": history_url
+    }
+
+
+@app.websocket("/ws/task/{task_id}")
+async def task_status_ws(
+    websocket: WebSocket,
+    task_id: str,
+    x_api_key: Optional[str] = Header(None)
+):
+    """Invia lo status del task ad ogni cambio (snapshot iniziale, poi solo i campi modificati)"""
+    if x_api_key != API_KEY:
+        await websocket.close(code=1008)
+        return
+    task_info = await _get_task_info(task_id)
+    if task_info is None:
+        await websocket.close(code=1008, reason="Task non trovato")
+        return
+    
+    await websocket.accept()
+    base_url = _base_url(websocket)
+    last_sent: Dict[str, Any] = {}
+    # Il client non invia nulla: la lettura serve solo ad accorgersi subito della disconnessione
+    receiver = asyncio.create_task(websocket.receive())
+    
+    try:
+        while task_info is not None:
+            # Registrato prima dello snapshot: un cambio durante send_json sveglia comunque il wait
+            event = _watch_task(task_id)
+            current = _build_task_status(task_id, task_info, base_url)
+            delta = {k: v for k, v in current.items() if last_sent.get(k, object()) != v}
+            if delta:
+                delta["task_id"] = task_id
+                await websocket.send_json(delta)
+                last_sent = current
+            if current["status"] in TERMINAL_STATUSES:
+                break
+            
+            changed = asyncio.create_task(event.wait())
+            done, _ = await asyncio.wait({receiver, changed}, timeout=WS_IDLE_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+            changed.cancel()
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect()
+                receiver = asyncio.create_task(websocket.receive())
+            elif not done:
+                logger.debug(f"⏱️ WebSocket del task {task_id} inattivo da {WS_IDLE_TIMEOUT}s: chiuso")
+                break
+            task_info = active_tasks.get(task_id)
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.debug(f"🔌 Client WebSocket disconnesso dal task {task_id}")
+    finally:
+        receiver.cancel()
 
 
 @app.post("/task-cancel/{task_id}")
@@ -400,20 +1135,23 @@ async def cancel_task(
     if task_info["status"] not in ["queued", "running"]:
         raise HTTPException(status_code=400, detail="Task non può essere cancellato")
     
-    # Ferma agent se attivo
-    if task_id in task_agents:
-        try:
-            agent = task_agents[task_id]
-            if hasattr(agent, 'state'):
-                agent.state.stopped = True
-        except Exception as e:
-            logger.error(f"❌ Errore fermando agent {task_id}: {e}")
+    # In modalità process il processo figlio non è interrompibile e continua a usare il profilo Chrome
+    # dell'utente: liberare l'utente permetterebbe un secondo Chrome sullo stesso user_data_dir
+    if _process_pool is not None and task_info["status"] == "running":
+        raise HTTPException(status_code=409, detail="Task in esecuzione in un processo separato: non cancellabile")
     
-    # Aggiorna status
+    # Aggiorna status (prima di interrompere: run_agent_task lo usa per distinguere dallo shutdown)
     task_info.update({
         "status": "cancelled",
-        "completed_at": datetime.now(timezone.utc).isoformat()
+        "completed_at_ns": time.time_ns()
     })
+    _notify_task(task_id)
+    _discard_active(task_info["user_id"], task_id)
+    
+    # Interrompe subito l'agent in esecuzione: i finally rilasciano sessione browser e indici
+    run = task_runs.get(task_id)
+    if run is not None:
+        run.cancel()
     
     logger.info(f"🚫 Task cancellato: {task_id}")
     
@@ -423,19 +1161,19 @@ async def cancel_task(
 @app.get("/user-tasks/{user_id}")
 async def get_user_tasks(
     user_id: str,
+    limit: Optional[int] = Query(None, ge=0),
     authorized: bool = Depends(verify_api_key)
 ):
-    """Ottiene tutti i task di un utente"""
+    """Ottiene i task di un utente, dal più recente"""
     
-    user_tasks = [
-        task for task in active_tasks.values() 
-        if task["user_id"] == user_id
-    ]
+    task_ids = user_to_tasks.get(user_id, [])
+    # L'indice è in ordine di creazione: basta scorrerlo al contrario
+    user_tasks = [_task_view(active_tasks[tid]) for tid in reversed(task_ids) if tid in active_tasks]
     
     return {
         "user_id": user_id,
         "total_tasks": len(user_tasks),
-        "tasks": sorted(user_tasks, key=lambda x: x["created_at"], reverse=True)
+        "tasks": user_tasks[:limit]
     }
 
 
@@ -455,17 +1193,33 @@ async def cleanup_user_session(
 def run_server(
     host: str = "0.0.0.0",
     port: int = 8000,
-    reload: bool = False
+    reload: bool = False,
+    workers: Optional[int] = None,
+    debug: bool = False,
+    keep_alive: int = 600
 ):
     """Avvia il server FastAPI"""
-    logger.info(f"🚀 Avvio Browser-use API server su {host}:{port}")
+    workers = workers or int(os.environ.get("WEB_CONCURRENCY", "1"))
+    logger.info(f"🚀 Avvio Browser-use API server su {host}:{port} ({workers} worker)")
+    
+    if workers > 1:
+        # Task, sessioni browser e code vivono nella memoria del singolo processo
+        logger.warning(
+            f"⚠️ {workers} worker avviati: task e sessioni browser non sono condivisi tra processi, "
+            "status e cancellazione funzionano solo sul worker che ha ricevuto il task"
+        )
     
     uvicorn.run(
         "browser_use.api.server:app",
         host=host,
         port=port,
         reload=reload,
-        log_level="info"
+        workers=workers,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        timeout_keep_alive=keep_alive,
+        access_log=debug,
+        log_level="debug" if debug else "info"
     )
 
 
@@ -476,7 +1230,9 @@ if __name__ == "__main__":
     parser.add_argument("--host", default="0.0.0.0", help="Host address")
     parser.add_argument("--port", type=int, default=8000, help="Port number")
     parser.add_argument("--reload", action="store_true", help="Enable auto-reload")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: WEB_CONCURRENCY or 1)")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging and access log")
     
     args = parser.parse_args()
     
-    run_server(host=args.host, port=args.port, reload=args.reload)
+    run_server(host=args.host, port=args.port, reload=args.reload, workers=args.workers, debug=args.debug)
@@ -10,6 +10,7 @@ Script completo per testare l'API browser-use con:
 """
 
 import asyncio
+import importlib.util
 import json
 import time
 from pathlib import Path
@@ -17,6 +18,17 @@ from typing import Dict, Any
 
 import httpx
 
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+
+TERMINAL_STATUSES = ("completed", "error", "cancelled", "stalled")
+
+# HTTP/2 richiede il pacchetto opzionale h2 (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
 
 class BrowserUseAPITester:
     """Tester per API browser-use"""
@@ -28,7 +40,16 @@ class BrowserUseAPITester:
     ):
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
-        self.client = httpx.AsyncClient(timeout=30.0)
+        # Un solo client con pool keep-alive condiviso da tutte le richieste (e task paralleli)
+        self.client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_keepalive_connections=64,
+                max_connections=128,
+                keepalive_expiry=600
+            )
+        )
         
         # Headers comuni
         self.headers = {
@@ -105,9 +126,45 @@ class BrowserUseAPITester:
         task_id: str,
         timeout: int = 120
     ) -> Dict[str, Any]:
-        """Monitora un task fino al completamento"""
+        """Monitora un task fino al completamento (push WebSocket, polling come fallback)"""
         print(f"🔍 Monitoring task: {task_id}")
         
+        if websockets is not None:
+            try:
+                return await asyncio.wait_for(self._stream_task(task_id), timeout)
+            except asyncio.TimeoutError:
+                print(f"⏰ Task monitoring timed out after {timeout}s")
+                return await self.get_task_status(task_id)
+            except (OSError, websockets.WebSocketException) as e:
+                print(f"⚠️ WebSocket non disponibile ({e}), fallback a polling")
+        
+        return await self._poll_task(task_id, timeout)
+    
+    async def _stream_task(self, task_id: str) -> Dict[str, Any]:
+        """Riceve gli aggiornamenti di status via WebSocket fino a uno stato finale"""
+        ws_url = self.base_url.replace("http", "ws", 1) + f"/ws/task/{task_id}"
+        status: Dict[str, Any] = {}
+        last_steps = 0
+        
+        async with websockets.connect(ws_url, additional_headers={"X-API-Key": self.api_key}) as ws:
+            async for message in ws:
+                # Il server invia uno snapshot iniziale e poi solo i campi modificati
+                status.update(json.loads(message))
+                
+                steps = status.get("steps_completed", 0)
+                if steps != last_steps:
+                    print(f"   📊 Status: {status.get('status')} - Steps: {steps}")
+                    last_steps = steps
+                
+                if status.get("status") in TERMINAL_STATUSES:
+                    self._print_task_finished(status)
+                    return status
+        
+        # Connessione chiusa senza stato finale (es. task rimosso)
+        return await self.get_task_status(task_id)
+    
+    async def _poll_task(self, task_id: str, timeout: int) -> Dict[str, Any]:
+        """Monitora un task interrogando /task-status ogni 5 secondi"""
         start_time = time.time()
         last_steps = 0
         
@@ -126,16 +183,8 @@ class BrowserUseAPITester:
                 last_steps = steps
             
             # Check completamento
-            if current_status in ["completed", "error", "cancelled", "stalled"]:
-                print(f"🏁 Task finished with status: {current_status}")
-                
-                if status.get("has_files"):
-                    print("📁 Output files available:")
-                    if status.get("history_url"):
-                        print(f"   📄 History: {status['history_url']}")
-                    if status.get("gif_url"):
-                        print(f"   🎬 GIF: {status['gif_url']}")
-                
+            if current_status in TERMINAL_STATUSES:
+                self._print_task_finished(status)
                 return status
             
             await asyncio.sleep(5)  # Check ogni 5 secondi
@@ -143,6 +192,17 @@ class BrowserUseAPITester:
         print(f"⏰ Task monitoring timed out after {timeout}s")
         return await self.get_task_status(task_id)
     
+    def _print_task_finished(self, status: Dict[str, Any]):
+        """Stampa l'esito finale di un task"""
+        print(f"🏁 Task finished with status: {status.get('status')}")
+        
+        if status.get("has_files"):
+            print("📁 Output files available:")
+            if status.get("history_url"):
+                print(f"   📄 History: {status['history_url']}")
+            if status.get("gif_url"):
+                print(f"   🎬 GIF: {status['gif_url']}")
+    
     async def test_basic_task(self, user_id: str = "test-user-1"):
         """Test task base"""
         print("\n" + "="*50)
@@ -199,11 +259,14 @@ class BrowserUseAPITester:
         ]
         
         # Avvia task in parallelo
-        task_results = []
-        for user_id, task in tasks:
-            result = await self.execute_task(task, user_id, max_steps=5)
-            if result:
-                task_results.append((user_id, result["task_id"]))
+        submitted = await asyncio.gather(
+            *(self.execute_task(task, user_id, max_steps=5) for user_id, task in tasks)
+        )
+        task_results = [
+            (user_id, result["task_id"])
+            for (user_id, _), result in zip(tasks, submitted)
+            if result
+        ]
         
         print(f"🚀 Started {len(task_results)} concurrent tasks")
         
@@ -4,161 +4,386 @@ Script per testare l'esecuzione di un task tramite API con monitoraggio status
 """
 
 import asyncio
+import importlib.util
 import json
-import time
+from functools import lru_cache
 import httpx
 
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+# uvloop (non disponibile su Windows) come event loop, altrimenti quello di default
+try:
+    import uvloop
+    _loop_factory = uvloop.new_event_loop
+except ImportError:
+    _loop_factory = None
+
+# orjson (se installato) decodifica direttamente i bytes della risposta, senza passare da str
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+    
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+
 API_URL = "http://localhost:8080"
 API_KEY = "AuanyrvoRIKzmIjw3saCmO5LWRE07X7IRu1"
+MONITOR_TIMEOUT = 300.0  # Timeout 5 minuti
+TERMINAL_STATUSES = frozenset(("completed", "error", "cancelled", "stalled"))
 
-async def execute_and_monitor_task():
-    """Esegue un task e monitora il suo status"""
+# Riga di progresso, stampata solo quando cambiano gli step
+_PROGRESS_FMT = "[{:3d}s] Status: {:12} | Steps: {:2d} | {}: {} | {}".format
+
+# Task eseguiti in parallelo da main() (uno per user_id)
+DEFAULT_PAYLOADS = [
+    {
+        "task": "vai su google.com e cerca 'browser automation python', poi dimmi quanti risultati trovi",
+        "user_id": "test-user-demo",
+        "max_steps": 15
+    }
+]
+
+# HTTP/2 richiede il pacchetto opzionale h2 (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Client condiviso: health, esecuzione e polling riusano lo stesso pool keep-alive.
+# Resta httpx (come nel resto del progetto): con push WebSocket, ETag e backoff il polling
+# fa al più ~1 richiesta/s per task, lontano dai carichi in cui il pool di httpcore è un collo di bottiglia
+_CLIENT = None
+
+
+def get_client():
+    """Restituisce il client HTTP condiviso, creandolo al primo uso"""
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        # keepalive_expiry oltre l'intervallo massimo di polling (15s): le connessioni idle non scadono
+        # tra un poll e l'altro, quindi niente nuovo connect né risoluzione DNS ad ogni richiesta
+        transport = httpx.AsyncHTTPTransport(
+            http2=HTTP2_AVAILABLE,
+            retries=1,  # Ritenta una volta i connect falliti
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60)
+        )
+        _CLIENT = httpx.AsyncClient(
+            base_url=API_URL,
+            transport=transport,
+            timeout=30.0,
+            headers={
+                "Content-Type": "application/json",
+                "X-API-Key": API_KEY
+            }
+        )
+    return _CLIENT
+
+
+async def close_client():
+    """Chiude il client condiviso (da chiamare prima di uscire dal loop)"""
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+def _print_final(status):
+    """Stampa l'esito di un task terminato"""
+    current_status = status.get("status", "unknown")
+    print("=" * 60)
+    print(f"🏁 Task {status.get('task_id', '')} completato con status: {current_status}")
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        headers = {
-            "Content-Type": "application/json",
-            "X-API-Key": API_KEY
-        }
-        
-        # 1. Health check
-        print("🔍 Controllo health API...")
-        try:
-            response = await client.get(f"{API_URL}/health")
-            if response.status_code == 200:
-                health = response.json()
-                print(f"✅ API attiva - Sessioni attive: {health.get('active_sessions', 0)}")
-            else:
-                print(f"❌ Health check fallito: {response.status_code}")
+    if current_status == "completed":
+        print("✅ Task eseguito con successo!")
+    elif current_status == "error":
+        print("❌ Task fallito con errore")
+        error_msg = status.get("error_message", "Nessun dettaglio errore")
+        print(f"   Errore: {error_msg}")
+    elif current_status == "stalled":
+        print("⏸️ Task bloccato (possibile timeout)")
+    
+    # Mostra info finali
+    completed_at = status.get("completed_at")
+    if completed_at:
+        print(f"   Completato: {completed_at}")
+    
+    # Mostra file output se disponibili
+    if status.get("has_files"):
+        print("\n📁 File output disponibili:")
+        if status.get("history_url"):
+            print(f"   📄 History JSON: {status['history_url']}")
+        if status.get("gif_url"):
+            print(f"   🎬 GIF recording: {status['gif_url']}")
+        if status.get("screenshots"):
+            print(f"   📸 Screenshots: {len(status['screenshots'])} disponibili")
+
+
+async def _stream_status(task_id):
+    """Riceve lo status dal WebSocket del server: snapshot iniziale, poi solo i campi cambiati"""
+    ws_url = API_URL.replace("http", "ws", 1) + f"/ws/task/{task_id}"
+    status = {}
+    async with websockets.connect(ws_url, additional_headers={"X-API-Key": API_KEY}) as ws:
+        async for message in ws:
+            status.update(_loads(message))
+            yield status
+
+
+async def _monitor_push(task_id, start, deadline):
+    """Monitora via push finché il task termina; None se il WebSocket non è disponibile, altrimenti l'ultimo status (anche non finale)"""
+    if websockets is None:
+        return None
+    
+    loop = asyncio.get_running_loop()
+    status = {}
+    
+    async def consume():
+        last_steps = None
+        update_count = 0
+        async for update in _stream_status(task_id):
+            status.update(update)
+            update_count += 1
+            steps = status.get("steps_completed", 0)
+            if steps != last_steps:
+                print(_PROGRESS_FMT(int(loop.time() - start), status.get("status", "unknown"), steps, "Update", update_count, task_id))
+                last_steps = steps
+            if status.get("status") in TERMINAL_STATUSES:
                 return
-        except Exception as e:
-            print(f"❌ Errore health check: {e}")
-            return
-        
-        # 2. Esegui task
-        print("\n🚀 Esecuzione task...")
-        task_payload = {
-            "task": "vai su google.com e cerca 'browser automation python', poi dimmi quanti risultati trovi",
-            "user_id": "test-user-demo",
-            "max_steps": 15
-        }
+    
+    try:
+        await asyncio.wait_for(consume(), timeout=deadline - loop.time())
+    except asyncio.TimeoutError:
+        pass
+    except (OSError, websockets.WebSocketException) as e:
+        if not status:
+            print(f"⚠️ WebSocket non disponibile ({e}), uso polling")
+            return None
+        print(f"❌ Connessione WebSocket interrotta: {e}")
+    return status
+
+
+async def _health(client):
+    """Health check dell'API (True se attiva)"""
+    print("🔍 Controllo health API...")
+    try:
+        response = await client.get("/health")
+        if response.status_code == 200:
+            health = _loads(response.content)
+            print(f"✅ API attiva ({response.http_version}) - Sessioni attive: {health.get('active_sessions', 0)}")
+            return True
+        print(f"❌ Health check fallito: {response.status_code}")
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"❌ Errore health check: {e}")
+    return False
+
+
+class StatusBatcher:
+    """Raggruppa le richieste di status arrivate entro `window` secondi in una sola GET /task-status?ids=..."""
+    
+    MAX_IDS = 100  # Limite del server per richiesta
+    
+    def __init__(self, client, window=0.1):
+        self._client = client
+        self._window = window
+        self._pending = {}
+        self._flush_task = None
+    
+    async def get(self, task_id):
+        """Status del task (None se il server non lo trova)"""
+        future = self._pending.get(task_id)
+        if future is None:
+            future = self._pending[task_id] = asyncio.get_running_loop().create_future()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        return await future
+    
+    async def _flush(self):
+        await asyncio.sleep(self._window)
+        pending, self._pending, self._flush_task = self._pending, {}, None
+        task_ids = list(pending)
         
         try:
-            response = await client.post(
-                f"{API_URL}/execute-task",
-                json=task_payload,
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                task_id = result["task_id"]
-                print(f"✅ Task avviato: {task_id}")
-                print(f"   User: {result['user_id']}")
-                print(f"   Session: {result.get('session_id', 'N/A')}")
-            else:
-                print(f"❌ Errore esecuzione task: {response.status_code}")
-                print(f"   Risposta: {response.text}")
-                return
+            statuses = {}
+            for i in range(0, len(task_ids), self.MAX_IDS):
+                response = await self._client.get(
+                    "/task-status",
+                    params={"ids": ",".join(task_ids[i:i + self.MAX_IDS])}
+                )
+                response.raise_for_status()
+                for status in _loads(response.content)["tasks"]:
+                    statuses[status["task_id"]] = status
         except Exception as e:
-            print(f"❌ Errore esecuzione task: {e}")
+            # Qualunque errore della richiesta bulk va a tutti i task in attesa
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
             return
         
-        # 3. Monitora status
-        print(f"\n🔍 Monitoraggio task {task_id}...")
-        print("=" * 60)
-        
-        start_time = time.time()
-        last_steps = 0
-        check_count = 0
+        for task_id, future in pending.items():
+            if not future.done():
+                future.set_result(statuses.get(task_id))
+
+
+@lru_cache(maxsize=256)
+def _encode_payload(items):
+    """Serializza un payload (come tupla di coppie) una sola volta"""
+    return _dumps(dict(items))
+
+
+async def _start_task(client, task_payload):
+    """Avvia un task e restituisce il suo task_id (None se fallisce)"""
+    print(f"\n🚀 Esecuzione task per {task_payload['user_id']}...")
+    try:
+        response = await client.post(
+            "/execute-task",
+            content=_encode_payload(tuple(task_payload.items()))
+        )
         
-        while time.time() - start_time < 300:  # Timeout 5 minuti
+        if response.status_code == 200:
+            result = _loads(response.content)
+            print(f"✅ Task avviato: {result['task_id']}")
+            print(f"   User: {result['user_id']}")
+            print(f"   Session: {result.get('session_id', 'N/A')}")
+            return result["task_id"]
+        print(f"❌ Errore esecuzione task: {response.status_code}")
+        print(f"   Risposta: {response.text}")
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"❌ Errore esecuzione task: {e}")
+    return None
+
+
+async def _fetch_status(client, status_path, etag=None, timeout=httpx.USE_CLIENT_DEFAULT):
+    """GET su status_path (/task-status/{task_id}) → (status_code, status o None, ETag da rinviare)"""
+    response = await client.get(
+        status_path,
+        headers={"If-None-Match": etag} if etag else None,
+        timeout=timeout
+    )
+    if response.status_code == 200:
+        return 200, _loads(response.content), response.headers.get("ETag")
+    return response.status_code, None, etag
+
+
+async def _monitor(client, task_id, batcher=None):
+    """Monitora un task fino a uno stato finale o al timeout (con `batcher` il polling è condiviso tra task)"""
+    print(f"\n🔍 Monitoraggio task {task_id}...")
+    print("=" * 60)
+    
+    # Clock monotono del loop: non risente delle correzioni NTP
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline = start + MONITOR_TIMEOUT
+    
+    pushed = await _monitor_push(task_id, start, deadline)
+    if pushed is not None and pushed.get("status") in TERMINAL_STATUSES:
+        _print_final(pushed)
+        return pushed
+    
+    # Push non disponibile o interrotto a metà: polling per il tempo rimanente
+    last_steps = 0
+    check_count = 0
+    interval = 1.0  # Backoff: riparte da 1s ad ogni nuovo step, max 15s
+    last_etag = None
+    loop_time = loop.time
+    status_path = f"/task-status/{task_id}"  # Fisso per questo task: calcolato una volta
+    final_status = None
+    
+    try:
+        while loop_time() < deadline:
             check_count += 1
             
             try:
-                response = await client.get(
-                    f"{API_URL}/task-status/{task_id}",
-                    headers=headers
-                )
+                if batcher is not None:
+                    status = await batcher.get(task_id)
+                    status_code = 200 if status is not None else 404
+                else:
+                    status_code, status, last_etag = await _fetch_status(client, status_path, last_etag)
                 
-                if response.status_code == 200:
-                    status = response.json()
-                    
-                    current_status = status.get("status", "unknown")
-                    steps = status.get("steps_completed", 0)
-                    created_at = status.get("created_at", "N/A")
+                if status_code == 304:
+                    # Status invariato: niente parsing né output
+                    interval = min(interval * 1.5, 15.0)
+                elif status_code == 200:
+                    get = status.get
+                    current_status, steps = get("status", "unknown"), get("steps_completed", 0)
                     
                     # Mostra aggiornamenti
                     if steps != last_steps or check_count == 1:
-                        elapsed = int(time.time() - start_time)
-                        print(f"[{elapsed:3d}s] Status: {current_status:12} | Steps: {steps:2d} | Check: {check_count}")
+                        print(_PROGRESS_FMT(int(loop_time() - start), current_status, steps, "Check", check_count, task_id))
                         last_steps = steps
+                        interval = 1.0
+                    else:
+                        interval = min(interval * 1.5, 15.0)
                     
                     # Check completamento
-                    if current_status in ["completed", "error", "cancelled", "stalled"]:
-                        print("=" * 60)
-                        print(f"🏁 Task completato con status: {current_status}")
-                        
-                        if current_status == "completed":
-                            print("✅ Task eseguito con successo!")
-                        elif current_status == "error":
-                            print("❌ Task fallito con errore")
-                            error_msg = status.get("error_message", "Nessun dettaglio errore")
-                            print(f"   Errore: {error_msg}")
-                        elif current_status == "stalled":
-                            print("⏸️ Task bloccato (possibile timeout)")
-                        
-                        # Mostra info finali
-                        completed_at = status.get("completed_at")
-                        if completed_at:
-                            print(f"   Completato: {completed_at}")
-                        
-                        # Mostra file output se disponibili
-                        if status.get("has_files"):
-                            print("\n📁 File output disponibili:")
-                            if status.get("history_url"):
-                                print(f"   📄 History JSON: {status['history_url']}")
-                            if status.get("gif_url"):
-                                print(f"   🎬 GIF recording: {status['gif_url']}")
-                            if status.get("screenshots"):
-                                print(f"   📸 Screenshots: {len(status['screenshots'])} disponibili")
-                        
-                        return status
+                    if current_status in TERMINAL_STATUSES:
+                        _print_final(status)
+                        final_status = status
+                        return final_status
                         
                 else:
-                    print(f"❌ Errore controllo status: {response.status_code}")
+                    print(f"❌ Errore controllo status: {status_code}")
+                    interval = min(interval * 2, 15.0)
                     
-            except Exception as e:
+            except httpx.TimeoutException:
+                print(f"⏱️ Timeout richiesta status {task_id}")
+                interval = min(interval * 2, 15.0)
+            except httpx.HTTPStatusError as e:
+                # Errore del bulk status (es. 5xx)
+                print(f"❌ Errore controllo status: {e.response.status_code}")
+                interval = min(interval * 2, 15.0)
+            except (httpx.TransportError, ValueError) as e:
                 print(f"❌ Errore monitoraggio: {e}")
+                interval = min(interval * 2, 15.0)
             
-            # Aspetta prima del prossimo check (intervallo crescente)
-            if check_count < 10:
-                await asyncio.sleep(3)  # Prime 10 volte: ogni 3 secondi
-            elif check_count < 30:
-                await asyncio.sleep(5)  # Successive 20 volte: ogni 5 secondi
-            else:
-                await asyncio.sleep(10) # Dopo: ogni 10 secondi
-        
-        print(f"⏰ Timeout monitoraggio dopo {int(time.time() - start_time)}s")
-        
-        # Ultimo check dello status
-        try:
-            response = await client.get(f"{API_URL}/task-status/{task_id}", headers=headers)
-            if response.status_code == 200:
-                final_status = response.json()
-                print(f"📊 Status finale: {final_status.get('status', 'unknown')}")
-                return final_status
-        except Exception as e:
-            print(f"❌ Errore check finale: {e}")
+            await asyncio.sleep(interval)
         
+        print(f"⏰ Timeout monitoraggio dopo {int(loop_time() - start)}s")
+    finally:
+        if final_status is None:
+            # Ultimo check dello status (anche se il monitoraggio viene cancellato), con timeout breve
+            try:
+                _, final_status, _ = await _fetch_status(client, status_path, timeout=5.0)
+                if final_status is not None:
+                    print(f"📊 Status finale {task_id}: {final_status.get('status', 'unknown')}")
+            except (httpx.HTTPError, ValueError) as e:
+                print(f"❌ Errore check finale: {e}")
+    
+    return final_status
+
+
+async def run_one(client, task_payload, batcher=None):
+    """Esegue un task e monitora il suo status"""
+    task_id = await _start_task(client, task_payload)
+    if task_id is None:
         return None
+    return await _monitor(client, task_id, batcher)
+
+
+async def main(payloads=DEFAULT_PAYLOADS):
+    """Esegue i task in parallelo sul client condiviso e ne rilascia le connessioni"""
+    client = get_client()
+    try:
+        if not await _health(client):
+            return []
+        # Un task per utente: il server rifiuta (409) un secondo task dello stesso user_id
+        # Con più task il polling passa da una sola richiesta bulk per finestra
+        batcher = StatusBatcher(client) if len(payloads) > 1 else None
+        return await asyncio.gather(*(run_one(client, payload, batcher) for payload in payloads))
+    finally:
+        await close_client()
 
 if __name__ == "__main__":
     print("🧪 BROWSER-USE API TASK TESTER")
     print("=" * 60)
     
-    result = asyncio.run(execute_and_monitor_task())
+    with asyncio.Runner(loop_factory=_loop_factory) as runner:
+        results = runner.run(main())
     
-    if result:
-        print(f"\n✅ Test completato - Status finale: {result.get('status', 'unknown')}")
-    else:
+    if not results:
         print(f"\n❌ Test fallito o interrotto")
+    for result in results:
+        if result:
+            print(f"\n✅ Test completato - {result.get('task_id')}: {result.get('status', 'unknown')}")
+        else:
+            print(f"\n❌ Test fallito o interrotto")
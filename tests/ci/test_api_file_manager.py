@@ -0,0 +1,166 @@
+"""
+Tests for the API task file manager (browser_use.api.file_manager).
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+# browser_use.api imports the server, which requires these at import time
+os.environ.setdefault('BROWSER_SERVICE_API_KEY', 'test-api-key')
+os.environ.setdefault('BROWSER_USE_DATA_DIR', tempfile.mkdtemp(prefix='browseruse_api_tests_'))
+
+from browser_use.api import file_manager
+from browser_use.api.file_manager import FileManager
+
+
+def _write(path, data: bytes):
+	path.parent.mkdir(parents=True, exist_ok=True)
+	path.write_bytes(data)
+
+
+def test_storage_stats_counts_and_sizes(tmp_path):
+	"""Tasks and users are counted as top-level dirs, archives as .zip files, sizes cover nested files"""
+	manager = FileManager(tmp_path)
+	_write(manager.tasks_dir / 'task-1' / 'task-1.json', b'x' * 10)
+	_write(manager.tasks_dir / 'task-1' / 'screenshots' / 'step_001.png', b'x' * 20)
+	_write(manager.tasks_dir / 'task-2' / 'task-2.json', b'x' * 5)
+	_write(manager.users_dir / 'user-1' / 'session.json', b'x' * 7)
+	_write(manager.archive_dir / 'task-0.zip', b'x' * 3)
+	_write(manager.archive_dir / 'notes.txt', b'x' * 100)
+
+	stats = manager.get_storage_stats()
+
+	assert stats['total_tasks'] == 2
+	assert stats['total_users'] == 1
+	assert stats['total_archives'] == 1
+	usage = stats['storage_usage']
+	assert usage['tasks_bytes'] == 35
+	assert usage['users_bytes'] == 7
+	assert usage['archives_bytes'] == 3
+	assert usage['total_bytes'] == 45
+	assert manager.get_task_size('task-1') == 30
+
+
+def test_storage_stats_cached_until_top_level_mtime_changes(tmp_path):
+	"""Nested writes are served from the cache; a change to a top-level dir mtime recomputes"""
+	manager = FileManager(tmp_path, stats_cache_ttl=3600)
+	_write(manager.tasks_dir / 'task-1' / 'task-1.json', b'x' * 10)
+	assert manager.get_storage_stats()['storage_usage']['tasks_bytes'] == 10
+
+	# A write inside an existing task dir leaves tasks/ untouched: still the cached result
+	_write(manager.tasks_dir / 'task-1' / 'task-1_error.json', b'x' * 5)
+	assert manager.get_storage_stats()['storage_usage']['tasks_bytes'] == 10
+
+	_write(manager.tasks_dir / 'task-2' / 'task-2.json', b'x' * 1)
+	os.utime(manager.tasks_dir, (1_000_000, 1_000_000))
+	stats = manager.get_storage_stats()
+	assert stats['total_tasks'] == 2
+	assert stats['storage_usage']['tasks_bytes'] == 16
+
+
+def test_storage_stats_cache_expires_after_ttl(tmp_path):
+	"""With an elapsed TTL nested changes become visible even if no top-level mtime moved"""
+	manager = FileManager(tmp_path, stats_cache_ttl=0)
+	_write(manager.tasks_dir / 'task-1' / 'task-1.json', b'x' * 10)
+	assert manager.get_storage_stats()['storage_usage']['tasks_bytes'] == 10
+
+	_write(manager.tasks_dir / 'task-1' / 'task-1_error.json', b'x' * 5)
+	assert manager.get_storage_stats()['storage_usage']['tasks_bytes'] == 15
+
+
+def test_storage_stats_returns_copies_of_the_cache(tmp_path):
+	"""Mutating a returned stats dict does not corrupt later cached results"""
+	manager = FileManager(tmp_path, stats_cache_ttl=3600)
+	_write(manager.tasks_dir / 'task-1' / 'task-1.json', b'x' * 10)
+
+	manager.get_storage_stats()['storage_usage']['tasks_bytes'] = -1
+	assert manager.get_storage_stats()['storage_usage']['tasks_bytes'] == 10
+
+
+async def test_streamed_history_matches_save_task_history(tmp_path):
+	"""save_task_history_stream writes the same document as save_task_history, consuming steps lazily"""
+	manager = FileManager(tmp_path)
+	steps = [{'step': i, 'action': f'click {i}', 'ok': True} for i in range(1, 4)]
+	metadata = {'user_id': 'user-1', 'task': 'test task', 'status': 'completed'}
+
+	buffered = json.loads((await manager.save_task_history('task-1', {**metadata, 'steps': steps})).read_bytes())
+	streamed_path = await manager.save_task_history_stream('task-2', metadata, (step for step in steps))
+	streamed = json.loads(streamed_path.read_bytes())
+
+	assert streamed_path == manager.get_task_dir('task-2') / 'task-2.json'
+	assert streamed['steps'] == steps
+	for document, task_id in ((buffered, 'task-1'), (streamed, 'task-2')):
+		assert document.pop('task_id') == task_id
+		assert document.pop('saved_at')
+	assert streamed == buffered
+
+
+async def test_streamed_history_without_steps(tmp_path):
+	"""An empty step iterable still produces a valid document with an empty steps array"""
+	manager = FileManager(tmp_path)
+
+	path = await manager.save_task_history_stream('task-1', {'steps': ['ignored'], 'status': 'error'}, [])
+
+	document = json.loads(path.read_bytes())
+	assert document['steps'] == []
+	assert document['status'] == 'error'
+	assert document['file_version'] == '1.0'
+
+
+async def test_save_screenshot_recreates_task_dir_removed_externally(tmp_path):
+	"""A task dir deleted outside cleanup_task must not leave a stale cached fd that breaks later saves"""
+	manager = FileManager(tmp_path)
+
+	first = await manager.save_screenshot('task-1', 1, b'first')
+	assert first.read_bytes() == b'first'
+
+	shutil.rmtree(manager.get_task_dir('task-1'))
+
+	second = await manager.save_screenshot('task-1', 2, b'second')
+	assert second.read_bytes() == b'second'
+	assert second.parent == manager.get_task_dir('task-1')
+
+
+async def test_save_screenshot_after_cleanup_task(tmp_path):
+	"""cleanup_task drops the cached fd, so a later save for the same task writes into a fresh dir"""
+	manager = FileManager(tmp_path)
+
+	await manager.save_screenshot('task-1', 1, b'first')
+	assert await manager.cleanup_task('task-1', archive_first=False)
+
+	screenshot = await manager.save_screenshot('task-1', 2, b'second')
+	assert screenshot.read_bytes() == b'second'
+	assert sorted(os.listdir(manager.get_task_dir('task-1'))) == ['step_002.jpg']
+
+
+async def test_fast_zlib_scoped_to_archive_zipfile(tmp_path, monkeypatch):
+	"""Archives use a private zipfile copy bound to the fast zlib; the shared zipfile module is never touched"""
+	used_during_archive = []
+
+	class FastZlib:
+		crc32 = staticmethod(zlib.crc32)
+
+		def __getattr__(self, name):
+			used_during_archive.append(name)
+			return getattr(zlib, name)
+
+	monkeypatch.setattr(file_manager, '_fast_zlib', FastZlib())
+	monkeypatch.setattr(file_manager, '_archive_zipfile', file_manager._load_fast_zipfile())
+	assert file_manager._archive_zipfile is not zipfile
+	manager = FileManager(tmp_path)
+	await manager.save_screenshot('task-1', 1, b'screenshot')
+	(manager.get_task_dir('task-1') / 'notes.txt').write_bytes(b'compressible ' * 100)
+
+	archive = await manager.archive_task('task-1')
+
+	assert 'compressobj' in used_during_archive
+	assert zipfile.zlib is zlib
+	assert zipfile.crc32 is zlib.crc32
+	with zipfile.ZipFile(archive) as zipf:
+		assert zipf.testzip() is None
+		assert zipf.getinfo('notes.txt').compress_type == zipfile.ZIP_DEFLATED
+		assert zipf.read('notes.txt') == b'compressible ' * 100
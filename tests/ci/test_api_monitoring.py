@@ -0,0 +1,120 @@
+"""
+Tests for the API task monitor stall detection (browser_use.api.monitoring).
+
+The monitor is driven with a fake monotonic clock and _check_stalled_tasks is called directly,
+so every wakeup of the monitoring loop can be simulated deterministically.
+"""
+
+import os
+import tempfile
+
+# browser_use.api imports the server, which requires these at import time
+os.environ.setdefault('BROWSER_SERVICE_API_KEY', 'test-api-key')
+os.environ.setdefault('BROWSER_USE_DATA_DIR', tempfile.mkdtemp(prefix='browseruse_api_tests_'))
+
+import pytest
+
+from browser_use.api import monitoring
+from browser_use.api.monitoring import TaskMonitor, TaskStatus
+
+
+class FakeClock:
+	"""Replacement for time.monotonic() controlled by the test"""
+
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self) -> float:
+		return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+	fake = FakeClock()
+	monkeypatch.setattr(monitoring.time, 'monotonic', fake)
+	return fake
+
+
+def _running_monitor(*task_ids: str) -> TaskMonitor:
+	monitor = TaskMonitor(stall_timeout=1, stall_check_interval=10, max_stall_checks=3)
+	for task_id in task_ids:
+		monitor.register_task(task_id, 'user-1')
+		monitor.update_task_status(task_id, TaskStatus.RUNNING)
+	return monitor
+
+
+async def test_progress_on_other_task_does_not_strike_idle_task(clock):
+	"""Wakeups caused by another task's progress must not add stall strikes to an idle task"""
+	monitor = _running_monitor('idle', 'busy')
+	idle = monitor.get_task_metrics('idle')
+
+	clock.now += 1.15
+	monitor.update_task_progress('busy', 1)
+	await monitor._check_stalled_tasks()
+	assert idle.stall_count == 1
+
+	# Each progress update wakes the monitoring loop and triggers a full check
+	for step in range(2, 7):
+		clock.now += 0.01
+		monitor.update_task_progress('busy', step)
+		await monitor._check_stalled_tasks()
+
+	assert idle.stall_count == 1
+	assert idle.status == TaskStatus.RUNNING
+
+
+async def test_idle_task_stalls_after_max_stall_checks_intervals(clock):
+	"""An idle task is struck once per stall_check_interval and stalls at the last strike"""
+	monitor = _running_monitor('idle')
+	idle = monitor.get_task_metrics('idle')
+
+	clock.now += 1.0
+	await monitor._check_stalled_tasks()
+	assert idle.stall_count == 1
+
+	clock.now += 9.5
+	await monitor._check_stalled_tasks()
+	assert idle.stall_count == 1
+
+	clock.now += 0.5
+	await monitor._check_stalled_tasks()
+	assert idle.stall_count == 2
+	assert idle.status == TaskStatus.RUNNING
+
+	clock.now += 10.0
+	await monitor._check_stalled_tasks()
+	assert idle.stall_count == 3
+	assert idle.status == TaskStatus.STALLED
+
+
+async def test_next_wakeup_follows_next_stall_check(clock):
+	"""After a strike the loop sleeps until that task's next stall check"""
+	monitor = _running_monitor('idle')
+
+	assert monitor._next_wakeup_timeout(last_cleanup=clock.now) == pytest.approx(1.0)
+
+	clock.now += 1.0
+	await monitor._check_stalled_tasks()
+	assert monitor._next_wakeup_timeout(last_cleanup=clock.now) == pytest.approx(10.0)
+
+
+async def test_progress_resets_stall_strikes(clock):
+	"""Progress clears the strikes and restarts the stall_timeout countdown"""
+	monitor = _running_monitor('task')
+	metrics = monitor.get_task_metrics('task')
+
+	clock.now += 1.0
+	await monitor._check_stalled_tasks()
+	assert metrics.stall_count == 1
+
+	clock.now += 0.5
+	monitor.update_task_progress('task', 1)
+	assert metrics.stall_count == 0
+
+	clock.now += 0.75
+	await monitor._check_stalled_tasks()
+	assert metrics.stall_count == 0
+
+	clock.now += 0.25
+	await monitor._check_stalled_tasks()
+	assert metrics.stall_count == 1
@@ -0,0 +1,738 @@
+"""
+Tests for the API server (browser_use.api.server).
+
+Browser sessions and agent runs are replaced with fakes, so no browser or LLM is started.
+"""
+
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+# browser_use.api.server requires these at import time
+os.environ.setdefault('BROWSER_SERVICE_API_KEY', 'test-api-key')
+os.environ.setdefault('BROWSER_USE_DATA_DIR', tempfile.mkdtemp(prefix='browseruse_api_tests_'))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from browser_use.api import server
+from browser_use.api.server import UserSessionManager
+
+
+def _task_record(task_id: str, user_id: str, status: str = 'running') -> dict:
+	"""Minimal in-memory task record, as created by /execute-task"""
+	return {
+		'task_id': task_id,
+		'user_id': user_id,
+		'status': status,
+		'steps_completed': 0,
+		'created_at_ns': time.time_ns(),
+	}
+
+
+def _complete(task_info: dict):
+	task_info.update(status='completed', completed_at_ns=time.time_ns(), has_history=True)
+
+
+class FakeBrowserSession:
+	"""Stands in for a started BrowserSession; records kill()"""
+
+	def __init__(self, user_id: str):
+		self.user_id = user_id
+		self.killed = False
+
+	async def kill(self):
+		self.killed = True
+
+
+@pytest.fixture
+def session_pool(monkeypatch):
+	created = {}
+
+	async def fake_create_session(user_id):
+		created[user_id] = FakeBrowserSession(user_id)
+		return created[user_id]
+
+	monkeypatch.setattr(UserSessionManager, '_create_session', staticmethod(fake_create_session))
+	monkeypatch.setattr(server, 'SESSION_POOL_MAX', 2)
+	monkeypatch.setattr(UserSessionManager, 'stats', {'hits': 0, 'misses': 0, 'evictions': 0})
+	yield created
+
+	server.user_sessions.clear()
+	UserSessionManager._last_used.clear()
+	UserSessionManager._in_use.clear()
+	UserSessionManager._locks.clear()
+	UserSessionManager._lock_users.clear()
+
+
+class BlockingKillSession(FakeBrowserSession):
+	"""kill() waits until the test opens the gate"""
+
+	def __init__(self, user_id: str):
+		super().__init__(user_id)
+		self.killing = asyncio.Event()
+		self.gate = asyncio.Event()
+
+	async def kill(self):
+		self.killing.set()
+		await self.gate.wait()
+		await super().kill()
+
+
+async def _use(user_id: str) -> FakeBrowserSession:
+	session = await UserSessionManager.acquire(user_id)
+	UserSessionManager.release(user_id)
+	return session
+
+
+async def test_session_pool_reuses_and_evicts_least_recently_used(session_pool):
+	"""A user's session is reused; past SESSION_POOL_MAX the least recently used idle one is killed"""
+	first = await _use('user-1')
+	await _use('user-2')
+	assert await _use('user-1') is first
+
+	await _use('user-3')
+
+	assert list(server.user_sessions) == ['user-1', 'user-3']
+	assert session_pool['user-2'].killed
+	assert not first.killed
+	assert UserSessionManager.stats == {'hits': 1, 'misses': 3, 'evictions': 1}
+
+
+async def test_session_pool_never_evicts_sessions_in_use(session_pool):
+	"""Sessions with a running task stay open even if the pool is over capacity"""
+	await UserSessionManager.acquire('user-1')
+	await UserSessionManager.acquire('user-2')
+	await UserSessionManager.acquire('user-3')
+
+	assert list(server.user_sessions) == ['user-1', 'user-2', 'user-3']
+	assert not any(session.killed for session in session_pool.values())
+
+	# Once released, the least recently used session is the first one evicted
+	UserSessionManager.release('user-1')
+	await _use('user-4')
+	assert session_pool['user-1'].killed
+	assert list(server.user_sessions) == ['user-2', 'user-3', 'user-4']
+
+
+async def test_evict_idle_closes_only_idle_released_sessions(session_pool):
+	"""evict_idle kills released sessions idle past max_idle, not recent or in-use ones"""
+	await _use('user-1')
+	await UserSessionManager.acquire('user-2')
+	UserSessionManager._last_used['user-1'] -= 100
+	UserSessionManager._last_used['user-2'] -= 100
+
+	assert await UserSessionManager.evict_idle(50) == 1
+
+	assert session_pool['user-1'].killed
+	assert list(server.user_sessions) == ['user-2']
+	assert UserSessionManager.stats['evictions'] == 1
+
+
+
+async def test_session_locks_are_dropped_with_their_session(session_pool, monkeypatch):
+	"""Per-user locks live only while the user has a pooled session or someone holds the lock"""
+	await _use('user-1')
+	await _use('user-2')
+	assert set(UserSessionManager._locks) == {'user-1', 'user-2'}
+
+	await server.cleanup_user_session('user-1', authorized=True)
+	monkeypatch.setattr(server, 'SESSION_POOL_MAX', 1)
+	await _use('user-3')  # evicts user-2
+
+	assert set(UserSessionManager._locks) == {'user-3'}
+	assert not UserSessionManager._lock_users
+
+	async def failing_create_session(user_id):
+		raise RuntimeError('browser did not start')
+
+	monkeypatch.setattr(UserSessionManager, '_create_session', staticmethod(failing_create_session))
+	with pytest.raises(RuntimeError):
+		await UserSessionManager.acquire('user-4')
+	assert set(UserSessionManager._locks) == {'user-3'}
+
+
+async def test_eviction_skips_session_acquired_while_another_is_killed(session_pool, monkeypatch):
+	"""A victim picked before an await is re-checked under its lock and kept if it became in use"""
+	monkeypatch.setattr(server, 'SESSION_POOL_MAX', 1)
+	first = BlockingKillSession('user-1')
+	server.user_sessions['user-1'] = first
+	for user_id in ('user-2', 'user-3'):
+		session_pool[user_id] = server.user_sessions[user_id] = FakeBrowserSession(user_id)
+
+	eviction = asyncio.create_task(UserSessionManager._evict_over_capacity())
+	await first.killing.wait()
+	# A task for user-2 takes its session while user-1's browser is still shutting down
+	UserSessionManager._in_use['user-2'] = 1
+	first.gate.set()
+	await eviction
+
+	assert first.killed
+	assert not session_pool['user-2'].killed
+	assert session_pool['user-3'].killed
+	assert list(server.user_sessions) == ['user-2']
+
+
+class FakeWebSocket:
+	"""Minimal WebSocket for task_status_ws; on_send runs while each message is being sent"""
+
+	def __init__(self, on_send=None):
+		self.on_send = on_send
+		self.url = SimpleNamespace(scheme='ws', netloc='testserver')
+		self.scope = {'type': 'websocket', 'scheme': 'ws'}
+		self.headers = {'host': 'testserver'}
+		self.sent = []
+		self.closed = False
+		self.incoming: asyncio.Queue = asyncio.Queue()
+
+	async def accept(self):
+		pass
+
+	async def receive(self):
+		return await self.incoming.get()
+
+	def disconnect(self):
+		self.incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1001})
+
+	async def send_json(self, data):
+		self.sent.append(data)
+		if self.on_send is not None:
+			self.on_send(len(self.sent))
+
+	async def close(self, code=1000, reason=None):
+		self.closed = True
+
+
+@pytest.fixture
+def ws_task():
+	task_id = 'task-4-00000004'
+	server.active_tasks[task_id] = _task_record(task_id, 'user-4')
+	yield task_id, server.active_tasks[task_id]
+
+	server.active_tasks.clear()
+	server._task_events.clear()
+
+
+async def _run_ws(websocket: FakeWebSocket, task_id: str):
+	await asyncio.wait_for(server.task_status_ws(websocket, task_id, x_api_key=server.API_KEY), timeout=1)
+
+
+async def test_ws_sends_snapshot_then_deltas_and_closes_on_terminal(ws_task):
+	"""The first message is the full status, later ones only the changed fields; a terminal status closes"""
+	task_id, task_info = ws_task
+
+	def progress(sent_count):
+		if sent_count == 1:
+			task_info['steps_completed'] = 1
+		else:
+			_complete(task_info)
+		server._notify_task(task_id)
+
+	websocket = FakeWebSocket(progress)
+	await _run_ws(websocket, task_id)
+
+	snapshot, step, done = websocket.sent
+	assert snapshot['status'] == 'running'
+	assert snapshot['steps_completed'] == 0
+	assert snapshot['history_url'] is None
+	assert step == {'steps_completed': 1, 'task_id': task_id}
+	assert set(done) == {'status', 'completed_at', 'has_files', 'history_url', 'task_id'}
+	assert done['status'] == 'completed'
+	assert done['history_url'] == f'http://testserver/files/{task_id}/{task_id}.json'
+	assert websocket.closed
+
+
+async def test_ws_closes_after_snapshot_of_finished_task(ws_task):
+	"""A task that already finished gets a single snapshot and the socket is closed"""
+	task_id, task_info = ws_task
+	_complete(task_info)
+
+	websocket = FakeWebSocket()
+	await _run_ws(websocket, task_id)
+
+	assert [message['status'] for message in websocket.sent] == ['completed']
+	assert websocket.closed
+
+
+async def test_ws_does_not_miss_change_notified_during_send(ws_task):
+	"""A _notify_task fired while the snapshot is being sent must wake the WebSocket handler"""
+	task_id, task_info = ws_task
+
+	def complete_on_first_send(sent_count):
+		if sent_count == 1:
+			_complete(task_info)
+			server._notify_task(task_id)
+
+	websocket = FakeWebSocket(complete_on_first_send)
+	# Without the event registered before the snapshot the handler would sleep until its 30s timeout
+	await _run_ws(websocket, task_id)
+
+	assert [message['status'] for message in websocket.sent if 'status' in message] == ['running', 'completed']
+	assert websocket.closed
+
+
+async def test_ws_exits_when_client_disconnects(ws_task):
+	"""A client that goes away is noticed right away, without waiting for the task to change"""
+	task_id, _ = ws_task
+
+	def client_messages_then_leaves(sent_count):
+		# Client messages are ignored; the disconnect ends the handler
+		websocket.incoming.put_nowait({'type': 'websocket.receive', 'text': 'ping'})
+		websocket.disconnect()
+
+	websocket = FakeWebSocket(client_messages_then_leaves)
+	await _run_ws(websocket, task_id)
+
+	assert [message['status'] for message in websocket.sent] == ['running']
+	assert not websocket.closed
+	assert task_id in server.active_tasks
+
+
+async def test_ws_closes_idle_connection(ws_task, monkeypatch):
+	"""A task that does not change for WS_IDLE_TIMEOUT closes the socket instead of holding it forever"""
+	task_id, _ = ws_task
+	monkeypatch.setattr(server, 'WS_IDLE_TIMEOUT', 0.05)
+
+	websocket = FakeWebSocket()
+	await _run_ws(websocket, task_id)
+
+	assert [message['status'] for message in websocket.sent] == ['running']
+	assert websocket.closed
+
+
+async def test_ws_rejects_wrong_api_key(ws_task):
+	"""A wrong X-API-Key closes the socket with 1008 before accepting"""
+	task_id, _ = ws_task
+	websocket = FakeWebSocket()
+
+	await server.task_status_ws(websocket, task_id, x_api_key='wrong-key')
+
+	assert websocket.closed
+	assert websocket.sent == []
+
+
+async def test_cancel_running_task_rejected_in_process_mode(monkeypatch):
+	"""In process mode a running task keeps its user active: cancelling it is refused with 409"""
+	monkeypatch.setattr(server, '_process_pool', object())
+	task_id = 'task-5-00000005'
+	server.active_tasks[task_id] = _task_record(task_id, 'user-5')
+	server.user_active['user-5'] = {task_id}
+	try:
+		with pytest.raises(server.HTTPException) as exc_info:
+			await server.cancel_task(task_id, authorized=True)
+		assert exc_info.value.status_code == 409
+		assert server.active_tasks[task_id]['status'] == 'running'
+		assert server.user_active['user-5'] == {task_id}
+
+		# Queued tasks have no child process yet and can still be cancelled
+		server.active_tasks[task_id]['status'] = 'queued'
+		await server.cancel_task(task_id, authorized=True)
+		assert server.active_tasks[task_id]['status'] == 'cancelled'
+		assert 'user-5' not in server.user_active
+	finally:
+		server.active_tasks.clear()
+		server.user_active.clear()
+
+
+@pytest.fixture
+async def file_writer(tmp_path, monkeypatch):
+	"""Runs the batching file writer on a temporary DATA_DIR"""
+	monkeypatch.setattr(server, 'DATA_DIR', tmp_path)
+	(tmp_path / 'tasks').mkdir()
+	writer = asyncio.create_task(server._file_writer())
+	yield tmp_path
+
+	writer.cancel()
+	await asyncio.gather(writer, return_exceptions=True)
+	server.active_tasks.clear()
+	server.user_to_tasks.clear()
+
+
+def _api_client() -> TestClient:
+	return TestClient(server.app, headers={'X-API-Key': server.API_KEY})
+
+
+async def test_user_tasks_newest_first_without_internal_fields(monkeypatch):
+	"""/user-tasks lists newest first, honours limit, hides has_history/has_gif and rejects a negative limit"""
+	task_ids = ['task-21-00000015', 'task-22-00000016', 'task-23-00000017']
+	monkeypatch.setattr(server, 'active_tasks', {tid: _task_record(tid, 'user-21') for tid in task_ids})
+	monkeypatch.setattr(server, 'user_to_tasks', {'user-21': list(task_ids)})
+	_complete(server.active_tasks[task_ids[0]])
+	client = _api_client()
+
+	payload = client.get('/user-tasks/user-21', params={'limit': 2}).json()
+
+	assert payload['total_tasks'] == 3
+	assert [task['task_id'] for task in payload['tasks']] == task_ids[:0:-1]
+	everything = client.get('/user-tasks/user-21').json()['tasks']
+	assert everything[-1]['completed_at']
+	for task in everything:
+		assert not {'has_history', 'has_gif'} & task.keys()
+		assert not any(key.endswith('_ns') for key in task)
+	assert client.get('/user-tasks/user-21', params={'limit': -1}).status_code == 422
+
+
+async def test_finished_tasks_are_evicted_to_disk(file_writer):
+	"""Tasks finished longer than TASK_RETENTION move to {task_id}_status.json; others stay in memory"""
+	old_ns = time.time_ns() - int(2 * server.TASK_RETENTION * 1e9)
+	expired, recent, running = 'task-6-00000006', 'task-7-00000007', 'task-8-00000008'
+	for task_id in (expired, recent, running):
+		server.active_tasks[task_id] = _task_record(task_id, 'user-6')
+	_complete(server.active_tasks[expired])
+	server.active_tasks[expired].update(created_at_ns=old_ns, completed_at_ns=old_ns)
+	_complete(server.active_tasks[recent])
+	server.active_tasks[running]['created_at_ns'] = old_ns
+	server.user_to_tasks['user-6'] = [expired, recent, running]
+
+	assert await server._evict_finished_tasks() == 1
+
+	assert expired not in server.active_tasks
+	assert server.user_to_tasks['user-6'] == [recent, running]
+	record_path = file_writer / 'tasks' / expired / f'{expired}_status.json'
+	assert json.loads(record_path.read_bytes())['status'] == 'completed'
+
+
+async def test_evicted_task_status_is_read_back_from_disk(file_writer):
+	"""/task-status serves an evicted task from its status record; malformed ids never reach the disk"""
+	task_id = 'task-9-00000009'
+	old_ns = time.time_ns() - int(2 * server.TASK_RETENTION * 1e9)
+	server.active_tasks[task_id] = _task_record(task_id, 'user-9')
+	_complete(server.active_tasks[task_id])
+	server.active_tasks[task_id]['completed_at_ns'] = old_ns
+	server.user_to_tasks['user-9'] = [task_id]
+	memory_status = _api_client().get(f'/task-status/{task_id}').json()
+
+	assert await server._evict_finished_tasks() == 1
+	assert task_id not in server.active_tasks
+
+	client = _api_client()
+	response = client.get(f'/task-status/{task_id}')
+	assert response.status_code == 200
+	assert response.json() == memory_status
+	assert client.get('/task-status/task-0-0000000z').status_code == 404
+
+
+@pytest.fixture
+def step_task(monkeypatch):
+	task_id = 'task-10-0000000a'
+	server.active_tasks[task_id] = _task_record(task_id, 'user-10')
+	notified = []
+	notify_task = server._notify_task
+
+	def counting_notify(tid):
+		notified.append(tid)
+		notify_task(tid)
+
+	monkeypatch.setattr(server, '_notify_task', counting_notify)
+	yield task_id, server.active_tasks[task_id], notified
+
+	server.active_tasks.clear()
+	server._step_slot.clear()
+	server._step_pending.clear()
+	server._task_events.clear()
+
+
+async def test_step_updates_coalesce_into_one_flush(step_task):
+	"""Steps recorded within one STEP_FLUSH_INTERVAL are applied once, with the most recent count"""
+	task_id, task_info, notified = step_task
+	flusher = asyncio.create_task(server._step_flusher())
+	try:
+		event = server._watch_task(task_id)
+		for steps in (1, 2, 3):
+			server._record_step(task_id, steps)
+		await asyncio.sleep(0)
+		assert task_info['steps_completed'] == 0
+
+		await asyncio.wait_for(event.wait(), timeout=1)
+		assert task_info['steps_completed'] == 3
+		assert notified == [task_id]
+
+		# Re-recording the applied count is flushed without a notification
+		server._record_step(task_id, 3)
+		await asyncio.sleep(3 * server.STEP_FLUSH_INTERVAL)
+		assert notified == [task_id]
+		assert not server._step_slot
+	finally:
+		flusher.cancel()
+		await asyncio.gather(flusher, return_exceptions=True)
+
+
+async def test_flush_task_steps_applies_pending_step_immediately(step_task):
+	"""_flush_task_steps applies the pending count without waiting for the flusher"""
+	task_id, task_info, notified = step_task
+
+	server._record_step(task_id, 5)
+	server._flush_task_steps(task_id)
+
+	assert task_info['steps_completed'] == 5
+	assert task_id not in server._step_slot
+	assert notified == [task_id]
+
+	server._flush_task_steps(task_id)
+	assert notified == [task_id]
+
+
+@pytest.fixture
+def artifacts(tmp_path, monkeypatch):
+	"""A task dir with a history JSON, its precompressed copy and a GIF, served from a temporary DATA_DIR"""
+	monkeypatch.setattr(server, 'DATA_DIR', tmp_path)
+	task_id = 'task-11-0000000b'
+	task_dir = tmp_path / 'tasks' / task_id
+	task_dir.mkdir(parents=True)
+	history = json.dumps({'task_id': task_id, 'steps': list(range(50))}).encode()
+	(task_dir / f'{task_id}.json').write_bytes(history)
+	(task_dir / f'{task_id}.json.gz').write_bytes(gzip.compress(history))
+	(task_dir / f'{task_id}.gif').write_bytes(b'GIF89a')
+	(task_dir / '.hidden').write_bytes(b'secret')
+	return task_id, history
+
+
+async def test_files_prefers_precompressed_json_for_gzip_clients(artifacts):
+	"""JSON artifacts come from the .gz sibling when the client accepts gzip, the plain file otherwise"""
+	task_id, history = artifacts
+	client = TestClient(server.app)
+
+	gzipped = client.get(f'/files/{task_id}/{task_id}.json', headers={'Accept-Encoding': 'gzip'})
+	assert gzipped.status_code == 200
+	assert gzipped.headers['content-encoding'] == 'gzip'
+	assert gzipped.headers['content-type'] == 'application/json'
+	assert 'Accept-Encoding' in gzipped.headers['vary']
+	assert gzipped.headers['cache-control'] == server.ARTIFACT_CACHE_CONTROL
+	assert gzipped.content == history
+
+	plain = client.get(f'/files/{task_id}/{task_id}.json', headers={'Accept-Encoding': 'identity'})
+	assert 'content-encoding' not in plain.headers
+	assert plain.content == history
+
+	gif = client.get(f'/files/{task_id}/{task_id}.gif', headers={'Accept-Encoding': 'gzip'})
+	assert 'content-encoding' not in gif.headers
+	assert 'Accept-Encoding' not in gif.headers.get('vary', '')
+	assert gif.content == b'GIF89a'
+
+
+async def test_files_honours_accept_encoding_q_values(artifacts):
+	"""gzip;q=0 refuses gzip even alongside other codings, while a positive wildcard accepts it"""
+	task_id, history = artifacts
+	client = TestClient(server.app)
+
+	for accept_encoding, gzipped in (
+		('gzip;q=0, identity', False),
+		('br, gzip; q=0.0', False),
+		('*;q=0.5', True),
+		('*, gzip;q=0', False),
+		('gzip;q=0.8, br', True),
+		('br', False),
+	):
+		response = client.get(f'/files/{task_id}/{task_id}.json', headers={'Accept-Encoding': accept_encoding})
+		assert response.status_code == 200, accept_encoding
+		assert (response.headers.get('content-encoding') == 'gzip') is gzipped, accept_encoding
+		assert response.content == history
+
+
+async def test_files_ignores_non_regular_gzip_sibling(artifacts, tmp_path):
+	"""A .gz sibling that is not a regular file falls back to the plain JSON"""
+	task_id, history = artifacts
+	gz_path = tmp_path / 'tasks' / task_id / f'{task_id}.json.gz'
+	gz_path.unlink()
+	gz_path.mkdir()
+	client = TestClient(server.app)
+
+	response = client.get(f'/files/{task_id}/{task_id}.json', headers={'Accept-Encoding': 'gzip'})
+
+	assert response.status_code == 200
+	assert 'content-encoding' not in response.headers
+	assert response.content == history
+
+
+async def test_files_revalidates_with_etag(artifacts):
+	"""A matching If-None-Match gets 304 with the artifact's caching headers"""
+	task_id, _ = artifacts
+	client = TestClient(server.app)
+
+	first = client.get(f'/files/{task_id}/{task_id}.json', headers={'Accept-Encoding': 'gzip'})
+	revalidated = client.get(
+		f'/files/{task_id}/{task_id}.json',
+		headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['etag']}
+	)
+
+	assert revalidated.status_code == 304
+	assert revalidated.headers['etag'] == first.headers['etag']
+	assert revalidated.headers['cache-control'] == server.ARTIFACT_CACHE_CONTROL
+
+
+async def test_files_rejects_names_outside_the_task_dir(artifacts):
+	"""Hidden files, malformed task ids, nested paths and missing files are all 404"""
+	task_id, _ = artifacts
+	client = TestClient(server.app)
+
+	for path in (
+		f'/files/{task_id}/.hidden',
+		f'/files/not-a-task/{task_id}.json',
+		f'/files/{task_id}/..%2F{task_id}%2F{task_id}.json',
+		f'/files/{task_id}/missing.json',
+	):
+		assert client.get(path).status_code == 404, path
+
+
+def _queue_task(task_id: str, user_id: str, task: str = 'test task') -> server.TaskRequest:
+	request = server.TaskRequest(task=task, user_id=user_id)
+	server.active_tasks[task_id] = _task_record(task_id, user_id, status='queued')
+	server.user_active.setdefault(user_id, set()).add(task_id)
+	server._task_queue.put_nowait((task_id, request))
+	return request
+
+
+@pytest.fixture
+async def worker(monkeypatch):
+	started = []
+
+	async def fake_run_agent_task(task_id, request):
+		started.append(task_id)
+		if request.task == 'blocking':
+			await asyncio.Event().wait()
+		server.active_tasks[task_id]['status'] = 'completed'
+
+	monkeypatch.setattr(server, 'run_agent_task', fake_run_agent_task)
+	task = asyncio.create_task(server._task_worker(0))
+	yield task, started
+
+	task.cancel()
+	await asyncio.gather(task, return_exceptions=True)
+	server.active_tasks.clear()
+	server.user_active.clear()
+	server.task_runs.clear()
+
+
+async def test_cancel_before_run_starts_keeps_worker_alive(worker):
+	"""A /task-cancel that lands before run_agent_task's first step must not kill the queue worker"""
+	worker_task, started = worker
+
+	_queue_task('task-1-00000001', 'user-1')
+	# The worker picks the task up and awaits the run, which has not executed yet
+	while 'task-1-00000001' not in server.task_runs:
+		await asyncio.sleep(0)
+	assert started == []
+
+	await server.cancel_task('task-1-00000001', authorized=True)
+	await asyncio.sleep(0.01)
+
+	assert not worker_task.done()
+	assert server.active_tasks['task-1-00000001']['status'] == 'cancelled'
+	assert 'task-1-00000001' not in server.task_runs
+
+	# The same worker still consumes the queue
+	_queue_task('task-2-00000002', 'user-2')
+	await asyncio.wait_for(server._task_queue.join(), timeout=1)
+	assert started == ['task-2-00000002']
+	assert server.active_tasks['task-2-00000002']['status'] == 'completed'
+
+
+async def test_worker_cancellation_still_propagates(worker):
+	"""Cancelling the worker itself (server shutdown) while a task runs still stops it"""
+	worker_task, started = worker
+
+	_queue_task('task-3-00000003', 'user-3', task='blocking')
+	while started != ['task-3-00000003']:
+		await asyncio.sleep(0)
+
+	worker_task.cancel()
+	with pytest.raises(asyncio.CancelledError):
+		await worker_task
+
+
+@pytest.fixture
+def status_tasks():
+	yield server.active_tasks
+
+	server.active_tasks.clear()
+
+
+async def test_task_status_etag_revalidation(status_tasks):
+	"""An unchanged status answers 304 to its ETag; any change yields a new ETag and a full body"""
+	task_id = 'task-12-0000000c'
+	status_tasks[task_id] = _task_record(task_id, 'user-12')
+	client = _api_client()
+
+	first = client.get(f'/task-status/{task_id}')
+	assert first.status_code == 200
+	assert first.headers['cache-control'] == 'no-cache'
+	etag = first.headers['etag']
+
+	unchanged = client.get(f'/task-status/{task_id}', headers={'If-None-Match': etag})
+	assert unchanged.status_code == 304
+	assert unchanged.content == b''
+	assert unchanged.headers['etag'] == etag
+
+	# A weak or listed validator matches too
+	assert client.get(f'/task-status/{task_id}', headers={'If-None-Match': f'"other", W/{etag}'}).status_code == 304
+
+	status_tasks[task_id]['steps_completed'] = 1
+	changed = client.get(f'/task-status/{task_id}', headers={'If-None-Match': etag})
+	assert changed.status_code == 200
+	assert changed.headers['etag'] != etag
+	assert changed.json()['steps_completed'] == 1
+
+
+async def test_bulk_task_status_returns_known_tasks_in_order(status_tasks):
+	"""GET /task-status?ids= returns each known task once, in request order, omitting unknown ids"""
+	first, second = 'task-13-0000000d', 'task-14-0000000e'
+	status_tasks[first] = _task_record(first, 'user-13')
+	status_tasks[second] = _task_record(second, 'user-14', status='queued')
+	client = _api_client()
+
+	response = client.get('/task-status', params={'ids': f'{second},task-0-00000000,{first},{second},'})
+
+	assert response.status_code == 200
+	tasks = response.json()['tasks']
+	assert [task['task_id'] for task in tasks] == [second, first]
+	assert tasks[0]['status'] == 'queued'
+	assert tasks[1] == client.get(f'/task-status/{first}').json()
+
+
+async def test_bulk_task_status_caps_ids_per_request(status_tasks):
+	"""More than TASK_STATUS_BATCH_MAX distinct ids is rejected; exactly the cap is accepted"""
+	client = _api_client()
+	ids = [f'task-{i}-00000000' for i in range(server.TASK_STATUS_BATCH_MAX + 1)]
+
+	assert client.get('/task-status', params={'ids': ','.join(ids)}).status_code == 400
+	capped = client.get('/task-status', params={'ids': ','.join(ids[:-1])})
+	assert capped.status_code == 200
+	assert capped.json() == {'tasks': []}
+	assert client.get('/task-status', params={'ids': ids[0]}, headers={'X-API-Key': 'wrong-key'}).status_code == 403
+
+
+async def test_get_llm_builds_one_instance_per_task_on_the_shared_client(monkeypatch):
+	"""Each task gets its own ChatOpenAI (agents wrap its ainvoke), all on the shared httpx client"""
+	shared_client = object()
+	monkeypatch.setattr(server, '_llm_http_client', shared_client)
+
+	first = server.get_llm('gpt-4o-mini')
+	second = server.get_llm('gpt-4o-mini')
+
+	assert first is not second
+	assert first.http_client is shared_client
+	assert second.http_client is shared_client
+
+
+async def test_stop_process_pool_terminates_running_children():
+	"""Shutdown does not leave a child that is still running a task (and its browser) behind"""
+	pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+	running = asyncio.wrap_future(pool.submit(time.sleep, 60))
+	while not pool._processes:
+		await asyncio.sleep(0.01)
+	children = list(pool._processes.values())
+	await asyncio.sleep(0.5)  # let the child pick up the call
+
+	started = time.monotonic()
+	await server._stop_process_pool(pool)
+
+	assert time.monotonic() - started < server.PROCESS_SHUTDOWN_TIMEOUT
+	assert not any(child.is_alive() for child in children)
+	with pytest.raises(Exception):
+		await asyncio.wait_for(running, timeout=5)